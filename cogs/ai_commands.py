@@ -5,6 +5,7 @@ from discord import app_commands, Interaction, Embed, Attachment
 from discord.ext import commands
 from typing import Optional, Literal
 from utils.embed_utils import send_embed, create_error_embed
+from utils.attachment_handler import is_image_filename
 import os
 
 logger = logging.getLogger(__name__)
@@ -262,7 +263,7 @@ class AICommands(commands.Cog):
                 if not api_cog:
                     api_cog = self.bot.get_cog("APIUtils")
                 
-                caption_result, caption_stats = await api_cog.send_request(
+                caption_result, caption_stats, _ = await api_cog.send_request(
                     model="openai/gpt-4.1-nano",
                     message_content=caption_prompt,
                     image_url=image_url,
@@ -445,7 +446,7 @@ class AICommands(commands.Cog):
                 
                 api_cog = self.bot.get_cog("APIUtils")
                 if api_cog:
-                    thread_name, _ = await api_cog.send_request(
+                    thread_name, _, _ = await api_cog.send_request(
                         model="openai/gpt-4.1-nano", 
                         message_content=name_prompt,
                         api="openrouter",
@@ -533,7 +534,7 @@ class AICommands(commands.Cog):
                     
                     api_cog = self.bot.get_cog("APIUtils")
                     if api_cog:
-                        thread_name, _ = await api_cog.send_request(
+                        thread_name, _, _ = await api_cog.send_request(
                             model="openai/gpt-4.1-nano", 
                             message_content=name_prompt,
                             api="openrouter",
@@ -622,7 +623,7 @@ class AICommands(commands.Cog):
         
         has_image = False
         if attachment:
-            has_image = attachment.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
+            has_image = is_image_filename(attachment.filename)
         
         model_config = self._get_model_config(model)
         if has_image and model_config and not model_config.get("supports_images", False):
@@ -673,7 +674,7 @@ class AICommands(commands.Cog):
         
         has_image = False
         if attachment:
-            has_image = attachment.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
+            has_image = is_image_filename(attachment.filename)
         
         model_config = self._get_model_config(model)
         if has_image and model_config and not model_config.get("supports_images", False):
@@ -767,8 +768,7 @@ class AIContextMenus(commands.Cog):
         
         def _check_for_images(self, message):
             if message.attachments:
-                return any(att.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')) 
-                        for att in message.attachments)
+                return any(is_image_filename(att.filename) for att in message.attachments)
             return False
             
         async def on_submit(self, interaction: discord.Interaction):
@@ -977,7 +977,7 @@ class ModelSelectionView(discord.ui.View):
         image_url = None
         if self.has_image:
             for att in self.original_message.attachments:
-                if att.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
+                if is_image_filename(att.filename):
                     image_url = att.url
                     logger.info(f"Found image attachment: {image_url}")
                     break
@@ -1034,11 +1034,7 @@ async def ai_context_menu(interaction: Interaction, message: discord.Message):
     else:
         content = message.content
     
-    has_images = False
-    for att in message.attachments:
-        if att.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            has_images = True
-            break
+    has_images = any(is_image_filename(att.filename) for att in message.attachments)
     
     reference_message = f"{message.author.name}: {content}"
     if has_images:
@@ -1049,18 +1045,9 @@ async def ai_context_menu(interaction: Interaction, message: discord.Message):
 
 @app_commands.context_menu(name="Generate with Image")
 async def edit_image_context_menu(interaction: Interaction, message: discord.Message):
-    # Count images in message
-    image_count = 0
-    
-    # Check attachments
-    for att in message.attachments:
-        if att.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            image_count += 1
-    
-    # Check embeds for images
-    for embed in message.embeds:
-        if embed.image:
-            image_count += 1
+    # Count images in message: image attachments plus embeds carrying an image
+    image_count = (sum(1 for att in message.attachments if is_image_filename(att.filename))
+                   + sum(1 for embed in message.embeds if embed.image))
     
     if image_count == 0:
         await interaction.response.send_message(
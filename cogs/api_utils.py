@@ -8,19 +8,104 @@ import base64
 import aiohttp
 import io
 import re
+import random
+import functools
+from urllib.parse import urlparse
 from PIL import Image
 from config_manager import config
+from utils.attachment_handler import image_mime_type
 
 logger = logging.getLogger(__name__)
 
+# :shortcode: emoji pattern and the ":id>" tail of an already formatted <:name:id> emoji
+_EMOJI_SHORTCODE_RE = re.compile(r':([a-zA-Z0-9_]+):')
+_TRAILING_ID_RE = re.compile(r'[0-9]+>')
+
+def _is_formatted_emoji(content: str, match: re.Match) -> bool:
+    """Whether a shortcode match is the name part of an already formatted <:name:id> or <a:name:id> emoji"""
+    # Checked per match instead of with lookarounds so a skipped match still consumes its text
+    # and the scan resumes after it; lookarounds would let the scan retry from the inner colons
+    start_pos = match.start()
+    if start_pos >= 2 and content[start_pos-2:start_pos] == '<:':
+        return True
+    if start_pos >= 3 and content[start_pos-3:start_pos] == '<a:':
+        return True
+    return _TRAILING_ID_RE.match(content, match.end()) is not None
+
+# Retry policy for OpenRouter generation stats lookups
+_STATS_RETRY_STATUSES = frozenset({404, 429, 500, 502, 503, 504})
+_STATS_RETRY_MAX_DELAY = 30.0
+
+# Markers of a 400 caused by the provider failing to fetch an image URL, as opposed to
+# a malformed request; only these are worth retrying with the image inlined as base64
+_IMAGE_FETCH_ERROR_CODES = frozenset({"invalid_image_url"})
+_IMAGE_FETCH_ERROR_MARKERS = ("download", "fetch", "retriev")
+
+def _is_image_fetch_error(error: openai.BadRequestError) -> bool:
+    """Whether a rejected request failed because the API could not retrieve the image URL"""
+    if getattr(error, 'code', None) in _IMAGE_FETCH_ERROR_CODES:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _IMAGE_FETCH_ERROR_MARKERS)
+
+# Images larger than this are base64-encoded in a worker thread
+_INLINE_B64_ENCODE_LIMIT = 512 * 1024
+
+# Inline images above this size are downscaled and re-encoded as WebP before base64;
+# the models don't need more than _IMAGE_MAX_DIMENSION pixels per side
+_IMAGE_SHRINK_THRESHOLD = 1024 * 1024
+_IMAGE_MAX_DIMENSION = 2048
+
+def _shrink_image(image_bytes: bytes) -> bytes | None:
+    """Downscale and re-encode an image as WebP. Returns None if that doesn't make it smaller."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.thumbnail((_IMAGE_MAX_DIMENSION, _IMAGE_MAX_DIMENSION))
+            has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+            output = io.BytesIO()
+            img.save(output, "WEBP", quality=85)
+    except Exception as e:
+        logger.warning(f"Could not shrink image, sending original: {e}")
+        return None
+    shrunk = output.getvalue()
+    return shrunk if len(shrunk) < len(image_bytes) else None
+
+def _tool_call_to_dict(tc) -> dict:
+    # Use model_dump() to preserve all fields including thought_signature
+    # This is required for Gemini 3 models which include reasoning metadata
+    if hasattr(tc, 'model_dump'):
+        return tc.model_dump(exclude_none=True)
+    # Fallback for older SDK versions
+    return {
+        "id": tc.id,
+        "type": tc.type,
+        "function": {
+            "name": tc.function.name,
+            "arguments": tc.function.arguments
+        }
+    }
+
+@functools.lru_cache(maxsize=256)
+def _compose_system_prompt(base_prompt, guild_id, guild_name, channel_id, channel_name, channel_type) -> str:
+    """Append the Discord server/channel context to a system prompt (cached per channel)"""
+    discord_context = f"\nCurrent Discord Context:\n"
+    discord_context += f"Server ID: {guild_id}\n"
+    discord_context += f"Server Name: {guild_name}\n"
+    discord_context += f"Channel ID: {channel_id}\n"
+    if channel_name:
+        discord_context += f"Channel Name: {channel_name}\n"
+    discord_context += f"Channel Type: {channel_type}\n\n"
+    return base_prompt + discord_context
+
 class APIUtils(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         
         # Initialize API clients using config manager
         api_config = config.get_api_clients_config()
-        self.OAICLIENT = openai.OpenAI(api_key=api_config['openai_api_key'])
-        self.OPENROUTERCLIENT = openai.OpenAI(
+        self.OAICLIENT = openai.AsyncOpenAI(api_key=api_config['openai_api_key'])
+        self.OPENROUTERCLIENT = openai.AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
             api_key=api_config['openrouter_api_key']
         )
@@ -30,18 +115,55 @@ class APIUtils(commands.Cog):
         self.FUN_SYSTEM_PROMPT = config.get_system_prompt(use_fun=True)
         self.BOT_TAG = config.get('bot_tag', '')
 
+        # Shared HTTP session (created in cog_load) so OpenRouter and Discord CDN
+        # requests reuse pooled keep-alive connections
+        self._session: aiohttp.ClientSession | None = None
+
+        # Per-guild emoji caches: guild_id -> (emoji count, value). Guild emoji sets rarely
+        # change; entries are dropped on on_guild_emojis_update and the count guards against
+        # missed events
+        self._emoji_list_cache: dict[int, tuple[int, str]] = {}
+        self._emoji_map_cache: dict[int, tuple[int, dict]] = {}
+
+        # Hosts whose image URLs the API failed to fetch; images from these are sent inline as base64
+        self._needs_base64_hosts: set[str] = set()
+
+    async def cog_load(self):
+        self._get_session()
+
+    async def cog_unload(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+        await self.OAICLIENT.close()
+        await self.OPENROUTERCLIENT.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Session for OpenRouter stats lookups and image downloads; created lazily if cog_load hasn't run"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, limit_per_host=16, keepalive_timeout=75)
+            )
+        return self._session
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild: discord.Guild, before, after):
+        self._emoji_list_cache.pop(guild.id, None)
+        self._emoji_map_cache.pop(guild.id, None)
+
     async def get_guild_emoji_list(self, guild: discord.Guild) -> str:
         if not guild or not guild.emojis:
             logger.info("No guild or no emojis found in guild")
             return ""
-        emoji_list = []
-        for emoji in guild.emojis:
-            if emoji.animated:
-                emoji_list.append(f"<a:{emoji.name}:{emoji.id}>")
-            else:
-                emoji_list.append(f"<:{emoji.name}:{emoji.id}>")
-        emoji_string = ",".join(emoji_list)
-        logger.info(f"Compiled emoji list with {len(emoji_list)} emojis")
+        emoji_count = len(guild.emojis)
+        cached = self._emoji_list_cache.get(guild.id)
+        if cached and cached[0] == emoji_count:
+            return cached[1]
+        emoji_string = ",".join(
+            f"<{'a' if emoji.animated else ''}:{emoji.name}:{emoji.id}>" for emoji in guild.emojis
+        )
+        self._emoji_list_cache[guild.id] = (emoji_count, emoji_string)
+        logger.info(f"Compiled emoji list with {emoji_count} emojis")
         return emoji_string
     
     def create_emoji_name_mapping(self, guild: discord.Guild) -> dict:
@@ -49,13 +171,17 @@ class APIUtils(commands.Cog):
         if not guild or not guild.emojis:
             return {}
         
-        emoji_mapping = {}
-        for emoji in guild.emojis:
-            if emoji.animated:
-                emoji_mapping[emoji.name.lower()] = f"<a:{emoji.name}:{emoji.id}>"
-            else:
-                emoji_mapping[emoji.name.lower()] = f"<:{emoji.name}:{emoji.id}>"
+        emoji_count = len(guild.emojis)
+        cached = self._emoji_map_cache.get(guild.id)
+        if cached and cached[0] == emoji_count:
+            return cached[1]
+        
+        emoji_mapping = {
+            emoji.name.lower(): f"<{'a' if emoji.animated else ''}:{emoji.name}:{emoji.id}>"
+            for emoji in guild.emojis
+        }
         
+        self._emoji_map_cache[guild.id] = (emoji_count, emoji_mapping)
         return emoji_mapping
     
     def _has_unmatched_emoji_patterns(self, content: str, guild: discord.Guild) -> list:
@@ -63,32 +189,22 @@ class APIUtils(commands.Cog):
         Find :emoji: patterns that don't match any server emoji.
         Returns list of unmatched emoji names.
         """
-        if not content or not guild:
+        if not content or not guild or content.count(':') < 2:
             return []
 
-        pattern = r':([a-zA-Z0-9_]+):'
         emoji_mapping = self.create_emoji_name_mapping(guild)
 
         unmatched = []
-        for match in re.finditer(pattern, content):
+        for match in _EMOJI_SHORTCODE_RE.finditer(content):
             emoji_name = match.group(1).lower()
             start_pos = match.start()
-            end_pos = match.end()
 
             # Skip if already a server emoji (exact match)
             if emoji_name in emoji_mapping:
                 continue
 
             # Skip if this is part of an already-formatted emoji <:name:id> or <a:name:id>
-            if start_pos > 0 and content[start_pos-1] == ':':
-                if start_pos > 1 and content[start_pos-2] == 'a':
-                    if start_pos > 2 and content[start_pos-3] == '<':
-                        continue
-                elif start_pos > 1 and content[start_pos-2] == '<':
-                    continue
-
-            # Skip if followed by numbers and > (already formatted)
-            if end_pos < len(content) and re.match(r'[0-9]+>', content[end_pos:]):
+            if _is_formatted_emoji(content, match):
                 continue
 
             # Skip if inside code blocks (backticks)
@@ -155,8 +271,7 @@ Rules:
 
         try:
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.OPENROUTERCLIENT.chat.completions.create,
+                self.OPENROUTERCLIENT.chat.completions.create(
                     model="google/gemini-2.0-flash-001",
                     messages=[{"role": "user", "content": prompt}],
                     max_tokens=len(content) + 500
@@ -184,49 +299,30 @@ Rules:
         if not content or not guild:
             return content
         
+        # A shortcode needs two colons; most responses have none, so skip building the mapping
+        if content.count(':') < 2:
+            return content
+        
         # Get emoji name mapping
         emoji_mapping = self.create_emoji_name_mapping(guild)
         if not emoji_mapping:
             return content
         
-        # Simple approach: find all :word: patterns and check if they're already formatted
-        pattern = r':([a-zA-Z0-9_]+):'
         substitution_count = 0
         
         def replace_emoji(match):
             nonlocal substitution_count
-            full_match = match.group(0)  # :word:
-            emoji_name = match.group(1).lower()
-            
-            # Check if this is part of an already formatted emoji by looking at context
-            start_pos = match.start()
-            end_pos = match.end()
-            
-            # Look for < before the match (allowing for 'a:' in animated emojis)
-            if start_pos > 0 and content[start_pos-1] == ':':
-                # This might be part of <:name: or <a:name:
-                if start_pos > 1 and content[start_pos-2] == 'a':
-                    # Check for <a:
-                    if start_pos > 2 and content[start_pos-3] == '<':
-                        return full_match  # Already formatted animated emoji
-                elif start_pos > 1 and content[start_pos-2] == '<':
-                    # Check for <:
-                    return full_match  # Already formatted emoji
-            
-            # Look for > after the match (indicating this is already formatted)
-            if end_pos < len(content) and re.match(r'[0-9]+>', content[end_pos:]):
-                return full_match  # Already formatted (has :id> after)
-            
-            # If emoji name matches a server emoji, convert it
-            if emoji_name in emoji_mapping:
-                logger.debug(f"Converting :{emoji_name}: to {emoji_mapping[emoji_name]}")
-                substitution_count += 1
-                return emoji_mapping[emoji_name]
-            
-            # Return original if not found (might be Unicode emoji)
-            return full_match
+            # Leave already formatted <:name:id> / <a:name:id> emojis alone
+            if _is_formatted_emoji(content, match):
+                return match.group(0)
+            replacement = emoji_mapping.get(match.group(1).lower())
+            if replacement is None:
+                # Return original if not found (might be Unicode emoji)
+                return match.group(0)
+            substitution_count += 1
+            return replacement
         
-        substituted_content = re.sub(pattern, replace_emoji, content)
+        substituted_content = _EMOJI_SHORTCODE_RE.sub(replace_emoji, content)
         
         # Log if any substitutions were made
         if substitution_count > 0:
@@ -237,66 +333,93 @@ Rules:
     async def fetch_generation_stats(self, generation_id: str) -> dict:
         logger.info(f"Fetching generation stats for ID: {generation_id}")
         max_retries = 3
-        retry_delay = 0.5
+        base_delay = 0.5
+        headers = {"Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}"}
+        url = f"https://openrouter.ai/api/v1/generation?id={generation_id}"
         
         for attempt in range(max_retries):
+            # Stats can lag the completion by a few seconds, so wait longer after each miss (capped);
+            # the random stretch keeps replies that finished together from polling together
+            delay = min(_STATS_RETRY_MAX_DELAY, base_delay * (2 ** attempt)) * (1 + random.random() * 0.5)
             try:
-                async with aiohttp.ClientSession() as session:
-                    headers = {"Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}"}
-                    url = f"https://openrouter.ai/api/v1/generation?id={generation_id}"
+                session = self._get_session()
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 200:
+                        stats = await response.json()
+                        logger.info(f"Successfully retrieved generation stats for ID: {generation_id}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Generation stats: %s", stats)
+                        return stats.get("data", {})
+                    
+                    error_text = await response.text()
+                    if response.status not in _STATS_RETRY_STATUSES:
+                        logger.error(f"Failed to fetch generation stats: HTTP {response.status}, {error_text}")
+                        return {}
                     
-                    async with session.get(url, headers=headers) as response:
-                        if response.status == 200:
-                            stats = await response.json()
-                            logger.info(f"Successfully retrieved generation stats: {stats}")
-                            return stats.get("data", {})
-                        elif response.status == 404:
-                            error_text = await response.text()
-                            logger.warning(f"Generation stats not found on attempt {attempt+1}/{max_retries}: {error_text}")
-                            
-                            if attempt < max_retries - 1:
-                                await asyncio.sleep(retry_delay)
-                                retry_delay *= 2
-                                continue
-                            else:
-                                logger.warning(f"Failed to fetch generation stats after {max_retries} attempts")
-                                return {}
-                        else:
-                            error_text = await response.text()
-                            logger.error(f"Failed to fetch generation stats: HTTP {response.status}, {error_text}")
-                            return {}
+                    # 404 means the stats are not recorded yet; 429/5xx are transient
+                    logger.warning(f"Generation stats unavailable (HTTP {response.status}) on attempt {attempt+1}/{max_retries}: {error_text}")
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = min(_STATS_RETRY_MAX_DELAY, max(delay, int(retry_after)))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error fetching generation stats on attempt {attempt+1}/{max_retries}: {e}")
             except Exception as e:
-                logger.exception(f"Error fetching generation stats on attempt {attempt+1}: {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 2
-                    continue
+                logger.exception(f"Error fetching generation stats: {e}")
                 return {}
+            
+            if attempt < max_retries - 1:
+                logger.info(f"Retrying generation stats fetch in {delay:.2f}s")
+                await asyncio.sleep(delay)
         
+        logger.warning(f"Failed to fetch generation stats after {max_retries} attempts")
         return {}
     
-    async def send_request(
+    async def _fetch_image_data_url(self, image_url: str) -> str | None:
+        """Download a Discord CDN image and return it as a base64 data URL"""
+        if not ("cdn.discordapp.com" in image_url or "media.discordapp.net" in image_url):
+            return None
+        return await self.fetch_image_data_url(image_url)
+    
+    async def fetch_image_data_url(self, image_url: str) -> str | None:
+        """Download an image from any URL and return it as a base64 data URL, or None on an HTTP error"""
+        session = self._get_session()
+        async with session.get(image_url) as response:
+            if response.status != 200:
+                logger.warning(f"Failed to download image for base64 fallback: HTTP {response.status}")
+                return None
+            image_bytes = await response.read()
+        
+        mime_type = image_mime_type(image_url)
+        
+        # Animated GIFs would lose their animation, so only still images are re-encoded
+        if len(image_bytes) > _IMAGE_SHRINK_THRESHOLD and mime_type != 'image/gif':
+            shrunk = await asyncio.to_thread(_shrink_image, image_bytes)
+            if shrunk:
+                logger.info(f"Shrunk inline image from {len(image_bytes)} to {len(shrunk)} bytes")
+                image_bytes = shrunk
+                mime_type = 'image/webp'
+        
+        # Encoding multi-megabyte images would stall the event loop
+        if len(image_bytes) > _INLINE_B64_ENCODE_LIMIT:
+            encoded = await asyncio.to_thread(base64.b64encode, image_bytes)
+        else:
+            encoded = base64.b64encode(image_bytes)
+        return f"data:{mime_type};base64,{encoded.decode('utf-8')}"
+    
+    async def _build_messages(
         self,
-        model: str,
         message_content: str,
         reference_message: str = None,
         image_url: str = None,
         use_fun: bool = False,
-        api: str = "openai",
         use_emojis: bool = False,
-        emoji_channel: discord.TextChannel = None,
-        max_tokens: int = 8000,
-        tools: list = None,
-        tool_choice: str = "auto",
-        response_format: dict = None
+        emoji_channel: discord.TextChannel = None
     ) -> tuple:
-        if api == "openrouter":
-            api_client = self.OPENROUTERCLIENT
-            logger.info(f"Using OpenRouter API for model: {model}")
-        else:
-            api_client = self.OAICLIENT
-            logger.info(f"Using OpenAI API for model: {model}")
-            
+        """
+        Build the chat messages for a single-turn request.
+        Returns (messages, direct_image_part); the latter is the image content part when
+        the image URL is passed through as-is, so a rejected URL can be swapped for base64.
+        """
         if use_fun:
             base_system_prompt = self.FUN_SYSTEM_PROMPT
         else:
@@ -305,30 +428,43 @@ Rules:
         # Add Discord context to system prompt if channel information is available
         system_used = base_system_prompt
         if emoji_channel and emoji_channel.guild:
-            discord_context = f"\nCurrent Discord Context:\n"
-            discord_context += f"Server ID: {emoji_channel.guild.id}\n"
-            discord_context += f"Server Name: {emoji_channel.guild.name}\n"
-            discord_context += f"Channel ID: {emoji_channel.id}\n"
-            if hasattr(emoji_channel, 'name') and emoji_channel.name:
-                discord_context += f"Channel Name: {emoji_channel.name}\n"
-            discord_context += f"Channel Type: {emoji_channel.type}\n\n"
-            system_used = base_system_prompt + discord_context
+            system_used = _compose_system_prompt(
+                base_system_prompt,
+                emoji_channel.guild.id,
+                emoji_channel.guild.name,
+                emoji_channel.id,
+                getattr(emoji_channel, 'name', None),
+                emoji_channel.type
+            )
         
-        message_content = message_content.replace(self.BOT_TAG, "")
+        if self.BOT_TAG and self.BOT_TAG in message_content:
+            message_content = message_content.replace(self.BOT_TAG, "")
 
-        messages_input = [{"role": "system", "content": f"{system_used}"}]
+        messages_input = [{"role": "system", "content": system_used}]
+        direct_image_part = None
+        
+        image_host = urlparse(image_url).hostname if image_url else None
         
+        # The emoji list and an inline (base64) image download are independent; fetch them together
+        pending = {}
         if use_emojis and emoji_channel:
-            emoji_list = await self.get_guild_emoji_list(emoji_channel.guild)
-            if emoji_list:
-                emoji_content = f"""List of available custom emojis: {emoji_list}
+            pending["emoji_list"] = self.get_guild_emoji_list(emoji_channel.guild)
+        if image_host in self._needs_base64_hosts:
+            pending["data_url"] = self._fetch_image_data_url(image_url)
+        fetched = dict(zip(pending, await asyncio.gather(*pending.values(), return_exceptions=True)))
+        
+        emoji_list = fetched.get("emoji_list")
+        if isinstance(emoji_list, Exception):
+            logger.error(f"Error building emoji list: {emoji_list}")
+        elif emoji_list:
+            emoji_content = f"""List of available custom emojis: {emoji_list}
 
         CRITICAL EMOJI RULES:
         - Use ONLY emojis from the above list with complete <:name:id> format
         - NEVER use :name: format - it will not work
         - Example: <:kibsmirk:1043092404959445013> ✅  vs :kibsmirk: ❌"""
-                
-                messages_input.append({"role": "system", "content": emoji_content})
+            
+            messages_input.append({"role": "system", "content": emoji_content})
                 
         if reference_message:
             messages_input.append({"role": "user", "content": reference_message})
@@ -339,35 +475,58 @@ Rules:
             try:
                 content_list = [{"type": "text", "text": message_content}]
                 
-                if image_url and ("cdn.discordapp.com" in image_url or "media.discordapp.net" in image_url):
-                    
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(image_url) as response:
-                            if response.status == 200:
-                                image_bytes = await response.read()
-                                if image_url.lower().endswith('.png'):
-                                    mime_type = 'image/png'
-                                elif image_url.lower().endswith(('.jpg', '.jpeg')):
-                                    mime_type = 'image/jpeg'
-                                elif image_url.lower().endswith('.webp'):
-                                    mime_type = 'image/webp'
-                                elif image_url.lower().endswith('.gif'):
-                                    mime_type = 'image/gif'
-                                else:
-                                    mime_type = 'image/jpeg'
-                                
-                                base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                                content_list.append({
-                                    "type": "image_url", 
-                                    "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}
-                                })
+                if "data_url" in fetched:
+                    data_url = fetched["data_url"]
+                    if isinstance(data_url, Exception):
+                        raise data_url
+                    if data_url:
+                        content_list.append({"type": "image_url", "image_url": {"url": data_url}})
+                elif image_host:
+                    # The API fetches the URL itself, saving a download and a 4/3x larger payload
+                    direct_image_part = {"type": "image_url", "image_url": {"url": image_url}}
+                    content_list.append(direct_image_part)
                     
                 messages_input.append({"role": "user", "content": content_list})
             except Exception as e:
                 logger.exception(f"Error processing image: {e}")
                 messages_input.append({"role": "user", "content": message_content})
         
-        logger.info("Sending API request with payload: %s", messages_input)
+        return messages_input, direct_image_part
+    
+    async def send_request(
+        self,
+        model: str,
+        message_content: str,
+        reference_message: str = None,
+        image_url: str = None,
+        use_fun: bool = False,
+        api: str = "openai",
+        use_emojis: bool = False,
+        emoji_channel: discord.TextChannel = None,
+        max_tokens: int = 8000,
+        tools: list = None,
+        tool_choice: str = "auto",
+        response_format: dict = None
+    ) -> tuple:
+        """
+        Send a single-turn chat request.
+        Always returns (content, generation_stats, tool_calls); tool_calls is None when the
+        model made no tool calls.
+        """
+        if api == "openrouter":
+            api_client = self.OPENROUTERCLIENT
+            logger.info(f"Using OpenRouter API for model: {model}")
+        else:
+            api_client = self.OAICLIENT
+            logger.info(f"Using OpenAI API for model: {model}")
+            
+        messages_input, direct_image_part = await self._build_messages(
+            message_content, reference_message, image_url, use_fun, use_emojis, emoji_channel
+        )
+        
+        # Payloads can carry long prompts and inline images; only render them when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending API request with payload: %s", messages_input)
         generation_stats = {}
         
         try:
@@ -387,64 +546,70 @@ Rules:
             if response_format:
                 request_params["response_format"] = response_format
             
-            response = await asyncio.to_thread(
-                api_client.chat.completions.create,
-                **request_params
-            )
+            try:
+                response = await api_client.chat.completions.create(**request_params)
+            except openai.BadRequestError as e:
+                if not direct_image_part or not _is_image_fetch_error(e):
+                    raise
+                # The API could not fetch the image URL; inline it for this and future requests
+                image_host = urlparse(image_url).hostname
+                logger.warning(f"API rejected image URL from {image_host}, falling back to base64: {e}")
+                self._needs_base64_hosts.add(image_host)
+                data_url = await self._fetch_image_data_url(image_url)
+                if not data_url:
+                    raise
+                direct_image_part["image_url"]["url"] = data_url
+                response = await api_client.chat.completions.create(**request_params)
             
             if not response:
                 logger.error("API returned None response")
-                return "I'm sorry, I received an empty response from the API. Please try again.", {}
+                return "I'm sorry, I received an empty response from the API. Please try again.", {}, None
                 
             if not hasattr(response, 'choices') or not response.choices:
                 logger.error("API response missing choices: %s", response)
-                return "I'm sorry, the API response was missing expected content. Please try again.", {}
+                return "I'm sorry, the API response was missing expected content. Please try again.", {}, None
                 
             if not hasattr(response.choices[0], 'message') or not response.choices[0].message:
                 logger.error("API response missing message in first choice: %s", response.choices[0])
-                return "I'm sorry, the API response structure was unexpected. Please try again.", {}
+                return "I'm sorry, the API response structure was unexpected. Please try again.", {}, None
                 
             if not hasattr(response.choices[0].message, 'content'):
                 logger.error("API response missing content in message: %s", response.choices[0].message)
-                return "I'm sorry, the response content was missing. Please try again.", {}
+                return "I'm sorry, the response content was missing. Please try again.", {}, None
             
             message = response.choices[0].message
             content = message.content
             
             # Check for tool calls
-            tool_calls = None
-            if hasattr(message, 'tool_calls') and message.tool_calls:
-                tool_calls = []
-                for tc in message.tool_calls:
-                    tool_calls.append({
-                        "id": tc.id,
-                        "type": tc.type,
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    })
+            raw_tool_calls = getattr(message, 'tool_calls', None)
+            tool_calls = [
+                {
+                    "id": tc.id,
+                    "type": tc.type,
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                }
+                for tc in raw_tool_calls
+            ] if raw_tool_calls else None
             
             if api == "openrouter" and hasattr(response, 'id'):
                 generation_id = response.id
                 logger.info(f"OpenRouter generation ID: {generation_id}")
                 generation_stats = await self.fetch_generation_stats(generation_id)
             
-            # Return content, stats, and tool_calls if any
-            if tool_calls:
-                return content, generation_stats, tool_calls
-            else:
-                return content, generation_stats
+            return content, generation_stats, tool_calls
         except openai.APIStatusError as e:
             # Re-raise 402 errors to be handled by the caller
             if e.status_code == 402:
                 logger.error(f"OpenRouter quota error (402): {e}")
                 raise
             logger.exception("API Status Error in request: %s", e)
-            return f"I'm sorry, there was an error communicating with the AI service: {str(e)}", {}
+            return f"I'm sorry, there was an error communicating with the AI service: {str(e)}", {}, None
         except Exception as e:
             logger.exception("Error in API request: %s", e)
-            return f"I'm sorry, there was an error communicating with the AI service: {str(e)}", {}
+            return f"I'm sorry, there was an error communicating with the AI service: {str(e)}", {}, None
     
     async def send_request_with_tools(
         self,
@@ -472,10 +637,7 @@ Rules:
                 request_params["tools"] = tools
                 request_params["tool_choice"] = tool_choice
             
-            response = await asyncio.to_thread(
-                api_client.chat.completions.create,
-                **request_params
-            )
+            response = await api_client.chat.completions.create(**request_params)
             
             if not response or not hasattr(response, 'choices') or not response.choices:
                 return {"error": "Invalid API response"}
@@ -501,30 +663,13 @@ Rules:
                             if isinstance(tc, dict) and 'thought_signature' in tc:
                                 logger.info(f"[Gemini 3 Debug] tool_call[{i}] has thought_signature: {tc['thought_signature'][:50]}...")
 
+            # Extract tool calls - preserve full structure for Gemini thought_signature support
+            tool_calls = getattr(message, 'tool_calls', None)
             result = {
                 "content": message.content,
-                "tool_calls": []
+                "tool_calls": [_tool_call_to_dict(tc) for tc in tool_calls] if tool_calls else []
             }
 
-            # Extract tool calls - preserve full structure for Gemini thought_signature support
-            if hasattr(message, 'tool_calls') and message.tool_calls:
-                for tc in message.tool_calls:
-                    # Use model_dump() to preserve all fields including thought_signature
-                    # This is required for Gemini 3 models which include reasoning metadata
-                    if hasattr(tc, 'model_dump'):
-                        tool_call_dict = tc.model_dump(exclude_none=True)
-                    else:
-                        # Fallback for older SDK versions
-                        tool_call_dict = {
-                            "id": tc.id,
-                            "type": tc.type,
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                    result["tool_calls"].append(tool_call_dict)
-
             # Preserve the raw message for conversation history (includes reasoning_details, etc.)
             # This is critical for Gemini 3 models that require thought_signature preservation
             if hasattr(message, 'model_dump'):
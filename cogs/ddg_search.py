@@ -6,22 +6,42 @@ from duckduckgo_search import DDGS
 import discord
 from discord.ext import commands
 import time
+import threading
+import random
 
 logger = logging.getLogger(__name__)
 
 class DuckDuckGo(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self._api_utils = None
+        # Searches run in worker threads; each thread keeps its own DDGS client (and its
+        # HTTP session) so concurrent searches don't contend for one client
+        self._ddgs_local = threading.local()
+
+    def _get_ddgs(self) -> DDGS:
+        """Return the calling thread's DDGS client, creating it on first use"""
+        ddgs = getattr(self._ddgs_local, "client", None)
+        if ddgs is None:
+            proxy = os.getenv("DUCK_PROXY")
+            ddgs = self._ddgs_local.client = DDGS(proxy=proxy) if proxy else DDGS()
+        return ddgs
+
+    def _get_api(self):
+        """Return the APIUtils cog, caching it after the first successful lookup"""
+        if self._api_utils is None:
+            self._api_utils = self.bot.get_cog("APIUtils")
+        return self._api_utils
 
     async def extract_search_query(self, user_message: str) -> str:
         logger.info("Extracting search query for message: %s", user_message)
-        api_utils = self.bot.get_cog("APIUtils")
+        api_utils = self._get_api()
         if not api_utils:
             logger.error("APIUtils cog not found")
             return ""
         
         try:
-            extracted_result = await api_utils.send_request(
+            extracted_query, _, _ = await api_utils.send_request(
                 model="gpt-4o-mini",
                 message_content=(
                     "Generate a concise search query that would fetch relevant information to answer or "
@@ -31,7 +51,6 @@ class DuckDuckGo(commands.Cog):
                 )
             )
             
-            extracted_query = extracted_result[0] if isinstance(extracted_result, tuple) else extracted_result
             extracted_query = extracted_query.strip()
             logger.info("Extracted search query: %s", extracted_query)
             return extracted_query
@@ -51,17 +70,13 @@ class DuckDuckGo(commands.Cog):
             
             for attempt in range(max_retries):
                 def _ddg_search():
-                    try:
-                        proxy = os.getenv("DUCK_PROXY")
-                        duck = DDGS(proxy=proxy) if proxy else DDGS()
-                        results = duck.text(q.strip('"').strip(), max_results=10)
-                        return results
-                    except Exception as e:
-                        raise e
+                    return self._get_ddgs().text(q.strip('"').strip(), max_results=10)
                 
                 try:
                     results = await asyncio.to_thread(_ddg_search)
-                    logger.info("DDG search results retrieved for query '%s': %s", q, results)
+                    logger.info("DDG search returned %d results for query '%s'", len(results or []), q)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("DDG search results for query '%s': %s", q, results)
                     return results
                     
                 except Exception as e:
@@ -70,8 +85,10 @@ class DuckDuckGo(commands.Cog):
                     # Check for rate limiting indicators
                     if any(indicator in error_msg for indicator in ['ratelimit', 'rate limit', '202', 'backoff']):
                         if attempt < max_retries - 1:
-                            delay = base_delay * (2 ** attempt)  # Exponential backoff
-                            logger.warning(f"DDG rate limit detected (attempt {attempt + 1}/{max_retries}), retrying in {delay}s: {e}")
+                            # DDG throttles by IP, so back off harder on each retry, up to 30s; the jitter
+                            # staggers searches that were throttled at the same moment
+                            delay = min(30, base_delay * (2 ** attempt)) * (1 + random.random() * 0.5)
+                            logger.warning(f"DDG rate limit detected (attempt {attempt + 1}/{max_retries}), retrying in {delay:.2f}s: {e}")
                             await asyncio.sleep(delay)
                             continue
                         else:
@@ -89,23 +106,24 @@ class DuckDuckGo(commands.Cog):
         if not results:
             logger.info("No results returned from DDG for query: %s", query)
             return ""
-        concat_result = f"Search query: {query}\n\n"
-        for i, result in enumerate(results, start=1):
-            title = result.get("title", "")
-            description = result.get("body", "")
-            concat_result += f"{i} -- {title}: {description}\n\n"
+        parts = [f"Search query: {query}"]
+        parts.extend(
+            f"{i} -- {result.get('title', '')}: {result.get('body', '')}"
+            for i, result in enumerate(results, start=1)
+        )
+        concat_result = "\n\n".join(parts) + "\n\n"
         logger.info("Formatted DDG search results for query: %s", query)
         return concat_result
 
     async def summarize_search_results(self, search_results: str) -> str:
         logger.info("Summarizing search results")
-        api_utils = self.bot.get_cog("APIUtils")
+        api_utils = self._get_api()
         if not api_utils:
             logger.error("APIUtils cog not found")
             return search_results
         
         try:
-            summary_result = await api_utils.send_request(
+            summary, _, _ = await api_utils.send_request(
                 model="gpt-4o-mini",
                 message_content=(
                     "Please summarize the following DuckDuckGo search results. "
@@ -114,7 +132,6 @@ class DuckDuckGo(commands.Cog):
                 )
             )
             
-            summary = summary_result[0] if isinstance(summary_result, tuple) else summary_result
             logger.info("Summary generated: %s", summary)
             return summary
         except Exception as e:
@@ -3,162 +3,537 @@ import asyncio
 import discord
 import openai
 import logging
+import math
+import functools
+import hashlib
+import re
+from collections import OrderedDict
 from discord.ext import commands
 from discord import app_commands
 from typing import Literal, Optional
 import aiohttp
+import httpx
 import io
+from urllib.parse import urlparse
 from utils.embed_utils import create_error_embed
+from utils.attachment_handler import is_image_filename, IMAGE_MIME_TYPES
 import os
-import base64
+try:
+    # SIMD-accelerated drop-in for the stdlib module; image payloads are multi-MB
+    import pybase64 as base64
+    _b64decode = base64.b64decode
+    # Encodes straight into a str, without the intermediate bytes object
+    _b64encode_str = base64.b64encode_as_string
+except ImportError:
+    import binascii
+    # What base64.b64decode calls after its argument checks; same lenient decoding
+    _b64decode = binascii.a2b_base64
+
+    def _b64encode_str(data) -> str:
+        # What base64.b64encode calls, taking any buffer without copying it first
+        return binascii.b2a_base64(data, newline=False).decode('ascii')
+try:
+    # httpx only speaks HTTP/2 when h2 is installed; concurrent API calls then multiplex one connection
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 from utils.quota_validator import quota_manager
 
 logger = logging.getLogger(__name__)
 
+# Model families: GPT models stream through the Responses API, Gemini goes through chat completions
+_GPT_IMAGE_MODELS = frozenset({"gpt-5-image-mini", "gpt-5-image"})
+_GEMINI_IMAGE_MODELS = frozenset({"gemini-2.5-flash-image", "gemini-3-pro-image-preview"})
+
+# OpenRouter model IDs; unknown models are passed through unchanged
+_OPENROUTER_MODEL_IDS = {
+    "gemini-2.5-flash-image": "google/gemini-2.5-flash-image",
+    "gemini-3-pro-image-preview": "google/gemini-3-pro-image-preview",
+    "gpt-5-image-mini": "openai/gpt-5-image-mini",
+    "gpt-5-image": "openai/gpt-5-image",
+}
+
+# Footer lookup tables
+_MODEL_DISPLAY_NAMES = {
+    "gemini-2.5-flash-image": "Gemini 2.5 Flash Image",
+    "gemini-3-pro-image-preview": "Gemini 3 Pro Image",
+    "gpt-5-image-mini": "GPT-5 Image Mini",
+    "gpt-5-image": "GPT-5 Image",
+}
+_QUALITY_LABELS = {
+    "high": "High Quality",
+    "hd": "High Quality",
+    "standard": "Low Quality",
+    "medium": "Low Quality",
+    "low": "Low Quality",
+}
+_ORIENTATION_LABELS = {
+    "1536x1024": "Landscape",
+    "1792x1024": "Landscape",
+    "1024x1536": "Portrait",
+    "1024x1792": "Portrait",
+    "1024x1024": "Square",
+}
+
+# Per-image pricing: model -> (high quality cost, other quality cost, edit multiplier)
+_IMAGE_COSTS = {
+    "gemini-2.5-flash-image": (0.039, 0.039, 1.0),
+    "gemini-3-pro-image-preview": (0.08, 0.08, 1.0),
+    "gpt-5-image-mini": (0.08, 0.04, 1.3),
+    "gpt-5-image": (0.20, 0.10, 1.3),
+}
+_DEFAULT_IMAGE_COST = 0.05
+
+# /gen quota pre-check estimate by (requested quality, uses multiple input images)
+_ESTIMATED_GEN_COSTS = {
+    ("high", False): 0.20,
+    ("high", True): 0.30,
+    ("low", False): 0.06,
+    ("low", True): 0.09,
+}
+
+# API quality string used when "low" is requested; "high" passes through for every model
+_LOW_QUALITY_BY_MODEL = {
+    "gpt-5-image-mini": "medium",
+    "gpt-5-image": "medium",
+}
+
+# Models restricted to bot administrators
+_ADMIN_ONLY_MODELS = frozenset({"gemini-3-pro-image-preview", "gpt-5-image"})
+
+# Output size per orientation; every supported model accepts the same three sizes
+_ORIENTATION_SIZES = {
+    "Landscape": "1536x1024",
+    "Portrait": "1024x1536",
+    "Square": "1024x1024",
+}
+
+# Embed colour used for every image reply, built once so Embed() doesn't wrap an int in a new Colour each time
+_EMBED_COLOR = discord.Colour(0x32a956)
+
+# Input image MIME types by lowercase file extension; the image APIs take every chat image type but GIF
+_EXT_MIME = {ext: mime_type for ext, mime_type in IMAGE_MIME_TYPES.items() if ext != ".gif"}
+
+# Attachment extensions accepted as image inputs
+_IMAGE_EXTS = frozenset(_EXT_MIME)
+
+# Base64 data URL prefix per image MIME type
+_DATA_URL_PREFIXES = {mime_type: f"data:{mime_type};base64," for mime_type in _EXT_MIME.values()}
+
+# Entries kept by the optional generation replay cache (IMAGE_GEN_CACHE)
+_GENERATION_CACHE_SIZE = 32
+
+# Downloaded input images are kept briefly so reopening the edit modal on the same message doesn't refetch them
+_INPUT_CACHE_TTL = 600
+_INPUT_CACHE_SIZE = 32
+# Larger images aren't kept, so the cache can't pin hundreds of MB of full-size uploads
+_INPUT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Image references in Gemini text responses: markdown images and bare data URLs
+_MARKDOWN_IMAGE_RE = re.compile(r'!\[.*?\]\((.*?)\)')
+_DATA_URL_RE = re.compile(r'data:image/[^;]+;base64,[A-Za-z0-9+/=]+')
+
+# Per-request limit for image downloads on the shared session
+_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=5)
+
+# Minimum seconds between streamed partial edits, so back-to-back partials share one message edit
+_PARTIAL_EDIT_DEBOUNCE = 0.25
+
+
+def _image_mime_type(image_input) -> str:
+    """MIME type for an input image buffer, derived from its name and cached on the buffer"""
+    mime_type = getattr(image_input, '_mime_cache', None)
+    if mime_type is None:
+        ext = os.path.splitext(getattr(image_input, 'name', 'image.png'))[1].lower()
+        mime_type = _EXT_MIME.get(ext, 'image/png')
+        image_input._mime_cache = mime_type
+    return mime_type
+
+
+def _decode_data_url(url: str) -> bytes:
+    """Decode a base64 data URL, slicing past the header instead of splitting the whole string"""
+    return _b64decode(url[url.index(",") + 1:])
+
+
+def _image_data_url(image_input) -> str:
+    """Base64 data URL of an input image buffer, cached on the buffer so retries don't re-encode"""
+    data_url = getattr(image_input, '_data_url_cache', None)
+    if data_url is None:
+        # getvalue() hands back the bytes the buffer was built from without copying or moving its position
+        image_base64 = _b64encode_str(image_input.getvalue())
+        data_url = _DATA_URL_PREFIXES[_image_mime_type(image_input)] + image_base64
+        image_input._data_url_cache = data_url
+    return data_url
+
+
+async def _encode_images(image_inputs: list) -> list[str]:
+    """Data URL for each input image, encoding off the event loop and in parallel"""
+    return await asyncio.gather(*(asyncio.to_thread(_image_data_url, image_input) for image_input in image_inputs))
+
+
+def _upload_file(image_input) -> tuple[str, bytes, str]:
+    """(filename, bytes, MIME type) upload tuple for an input image; unlike the buffer itself it has
+    no read position, so a retried request re-sends the full image"""
+    return getattr(image_input, 'name', 'image.png'), image_input.getvalue(), _image_mime_type(image_input)
+
+
+def _usage_fields(usage) -> dict:
+    """Field snapshot of an API usage object; pydantic models dump directly, anything else falls back to vars()"""
+    return usage.model_dump() if hasattr(usage, 'model_dump') else vars(usage)
+
+
+@functools.lru_cache(maxsize=1024)
+def _format_footer(model: str, quality: str, size: str, is_edit: bool, num_images: int, cost: float, generation_time: float, input_tokens: int, output_tokens: int) -> str:
+    """Footer text for an image reply; memoized since most generations repeat the same model/quality/cost combination"""
+    # First line: Model name with modifiers
+    footer_parts = []
+
+    # Model name
+    footer_parts.append(_MODEL_DISPLAY_NAMES.get(model, model))
+
+    # Quality and orientation (only for GPT models)
+    if model in _GPT_IMAGE_MODELS:
+        quality_label = _QUALITY_LABELS.get(quality)
+        if quality_label:
+            footer_parts.append(quality_label)
+        orientation_label = _ORIENTATION_LABELS.get(size)
+        if orientation_label:
+            footer_parts.append(orientation_label)
+    
+    # Mode (if using input images)
+    if num_images:
+        mode_text = "Edit" if is_edit else "Input"
+        footer_parts.append(mode_text)
+        if num_images > 1:
+            footer_parts.append(f"{num_images} images")
+    
+    first_line = " | ".join(footer_parts)
+    
+    # Second line: Usage stats (standardized format)
+    usage_parts = []
+    
+    # Token usage (if reported) - rare for image generation
+    if input_tokens > 0:
+        if input_tokens >= 1000:
+            input_str = f"{input_tokens / 1000:.1f}k"
+        else:
+            input_str = str(input_tokens)
+        usage_parts.append(f"{input_str} input tokens")
+    if output_tokens > 0:
+        if output_tokens >= 1000:
+            output_str = f"{output_tokens / 1000:.1f}k"
+        else:
+            output_str = str(output_tokens)
+        usage_parts.append(f"{output_str} output tokens")
+    
+    # Cost (show $x.xx, but to first non-zero digit if under $0.01)
+    if cost >= 0.01:
+        cost_str = f"${cost:.2f}"
+    elif cost > 0:
+        # First non-zero digit sits at -floor(log10(cost)) places; the correction step covers log10
+        # rounding up to an exact power of ten for values just below it
+        decimal_places = -math.floor(math.log10(cost))
+        if cost < 1 / (10 ** decimal_places):
+            decimal_places += 1
+        decimal_places = min(10, max(2, decimal_places))
+        cost_str = f"${cost:.{decimal_places}f}"
+    else:
+        cost_str = "$0.00"
+    usage_parts.append(cost_str)
+    
+    # Time
+    if generation_time > 0:
+        usage_parts.append(f"{generation_time} seconds")
+    
+    second_line = " | ".join(usage_parts)
+    
+    return f"{first_line}\n{second_line}"
+
+
+class _Truncated:
+    """Log argument that shortens a long string only if the record is actually emitted"""
+    __slots__ = ('text', 'limit')
+
+    def __init__(self, text: str, limit: int):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self):
+        return self.text if len(self.text) <= self.limit else self.text[:self.limit] + "..."
+
+
+class _RequestBucket:
+    """Token bucket that spaces outbound image API requests to a per-minute budget;
+    a budget of zero or less disables the limit"""
+
+    def __init__(self, per_minute: float):
+        self.enabled = per_minute > 0
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.enabled:
+            return
+        # Waiters queue on the lock, so requests are released in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                logger.info(f"Image API request budget exhausted, waiting {wait:.2f}s")
+                await asyncio.sleep(wait)
+
+
 class ImageGen(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.openrouter_client = openai.OpenAI(
+        # Async clients so image requests and streamed partials never block the event loop;
+        # they share one connection pool so overlapping /gen calls reuse warm connections
+        self._api_http = openai.DefaultAsyncHttpxClient(
+            http2=_HTTP2,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60)
+        )
+        self.openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=self._api_http)
+        self.openrouter_client = openai.AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY")
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            http_client=self._api_http
         )
+        # Shared HTTP session (created in cog_load) so image downloads reuse pooled connections
+        self._http: aiohttp.ClientSession | None = None
+        # Caps concurrent image downloads now that they are gathered, so bursts queue instead of tripping CDN limits
+        self._download_sem = asyncio.Semaphore(int(os.getenv("IMAGE_DOWNLOAD_CONCURRENCY", "8")))
+        # Throttles generation calls locally so bursts wait here instead of bouncing off provider 429s
+        self._request_bucket = _RequestBucket(float(os.getenv("IMAGE_GEN_RPM", "30")))
+        # Optional in-memory replay cache for identical non-streaming generations: "off" (default) or "on"
+        self._generation_cache_enabled = os.getenv("IMAGE_GEN_CACHE", "off").lower() == "on"
+        self._generation_cache: OrderedDict[str, tuple] = OrderedDict()
+        self._inflight_generations: dict[str, asyncio.Task] = {}
+        # (kind, id) -> (stored_at, bytes) for source images; Discord attachments are immutable
+        self._input_image_cache: OrderedDict[tuple, tuple[float, bytes]] = OrderedDict()
+
+    async def cog_load(self):
+        self._get_http()
+
+    async def cog_unload(self):
+        if self._http:
+            await self._http.close()
+            self._http = None
+        # Both API clients run on this pool, so closing it once releases their connections
+        await self._api_http.aclose()
+
+    def _get_http(self) -> aiohttp.ClientSession:
+        """Pooled session for result and source image downloads; reopened if it was closed or cog_load never ran"""
+        if self._http is None or self._http.closed:
+            # Per-host cap keeps one slow CDN from holding every pooled connection; the timeout
+            # bounds a stalled download so it can't hold up the reply. trust_env picks up HTTP(S)_PROXY
+            # like the httpx pool used by the API clients does
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=60),
+                timeout=_DOWNLOAD_TIMEOUT,
+                trust_env=True
+            )
+        return self._http
+
+    @staticmethod
+    async def _read_image_body(resp: aiohttp.ClientResponse) -> io.BytesIO:
+        """Read a response body into a file buffer pre-sized from Content-Length when the server sends one"""
+        buf = io.BytesIO()
+        expected = resp.content_length or 0
+        if expected:
+            # Extend the buffer to its final size so the chunk writes below fill it in place
+            buf.seek(expected - 1)
+            buf.write(b"\0")
+            buf.seek(0)
+        # iter_any hands over each chunk as it arrives instead of re-slicing the stream into fixed-size pieces
+        async for chunk in resp.content.iter_any():
+            buf.write(chunk)
+        buf.truncate()
+        buf.seek(0)
+        return buf
+
+    async def _load_result_image(self, url) -> Optional[io.BytesIO]:
+        """Turn one generation result (raw bytes, data URL or remote URL) into a file buffer, or None on failure"""
+        try:
+            # BytesIO shares an immutable bytes buffer instead of copying it
+            if isinstance(url, bytes):
+                # Raw image bytes from streaming generation or decoded b64_json results
+                return io.BytesIO(url)
+            if url.startswith("data:image/"):
+                # Handle base64 data URLs
+                return io.BytesIO(_decode_data_url(url))
+            # Handle regular URLs
+            async with self._download_sem, self._get_http().get(url) as resp:
+                if resp.status != 200:
+                    logger.error("Failed to fetch image from URL: %s", url)
+                    return None
+                return await self._read_image_body(resp)
+        except Exception:
+            logger.exception("Error processing generated image")
+            return None
+        
+    async def _materialize_results(self, result_urls: list, prompt: str, footer_text: str) -> tuple[list[discord.File], list[discord.Embed]]:
+        """Files and matching embeds for a generation's results, in result order; failed results are skipped"""
+        files = []
+        embeds = []
         
+        if all(isinstance(url, bytes) or url.startswith("data:image/") for url in result_urls):
+            # Inline results (raw bytes, data URLs) never wait on I/O, so decode them directly without tasks
+            image_files = [await self._load_result_image(url) for url in result_urls]
+        else:
+            # Fetch/decode every result concurrently (downloads are bounded by _download_sem). _load_result_image
+            # turns failures into None, so the group only cancels on something unexpected.
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(self._load_result_image(url)) for url in result_urls]
+            image_files = [task.result() for task in tasks]
+        # Assemble embeds in the original order
+        for idx, (url, image_file) in enumerate(zip(result_urls, image_files)):
+            if image_file is None:
+                continue
+            filename = f"generated_image_{idx}.png"
+            file = discord.File(image_file, filename=filename)
+            embed = discord.Embed(title="", description=prompt, color=_EMBED_COLOR)
+            embed.set_image(url=f"attachment://{filename}")
+            if not embeds:  # Only add footer to the first embed, even if an earlier result failed
+                embed.set_footer(text=footer_text)
+            
+            files.append(file)
+            embeds.append(embed)
+            if isinstance(url, bytes):
+                logger.info("Processed generated image from %d raw bytes", len(url))
+            else:
+                logger.info("Processed generated image for URL: %s", _Truncated(url, 50))
+        return files, embeds
+
+    @staticmethod
+    def _generation_cache_key(user_id: str, prompt: str, model: str, quality: str, size: str, is_edit: bool, image_inputs: list) -> str:
+        """Deterministic key over everything that determines a generation request; keyed per user so a
+        replayed (uncharged) result only ever goes back to the user who paid for it"""
+        digest = hashlib.sha256()
+        for part in (user_id, prompt, model, quality, size, str(is_edit)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        for image_input in image_inputs:
+            digest.update(hashlib.sha256(image_input.getvalue()).digest())
+        return digest.hexdigest()
+
+    def _get_cached_generation(self, key: str) -> Optional[tuple]:
+        """Return (result_urls, usage_info) for a previous identical generation, if any"""
+        cached = self._generation_cache.get(key)
+        if cached is not None:
+            self._generation_cache.move_to_end(key)
+            logger.info("Replaying cached image generation %s", key[:12])
+        return cached
+
+    def _store_generation(self, key: str, result_urls: list, usage_info: dict):
+        """Remember a generation result for replay, evicting the least recently used entry"""
+        self._generation_cache[key] = (result_urls, usage_info)
+        self._generation_cache.move_to_end(key)
+        if len(self._generation_cache) > _GENERATION_CACHE_SIZE:
+            self._generation_cache.popitem(last=False)
+
+    async def _generate_with_cache(self, user_id: str, img_prompt: str, img_quality: str, img_size: str, model: str, image_inputs: list, is_edit: bool):
+        """generate_image behind the opt-in replay cache; a replayed result reports zero cost so it isn't charged again"""
+        if not self._generation_cache_enabled:
+            return await self.generate_image(img_prompt, img_quality, img_size, model, image_inputs, is_edit)
+        # Hashing the input images is CPU work, so keep it off the event loop
+        cache_key = await asyncio.to_thread(
+            self._generation_cache_key, user_id, img_prompt, model, img_quality, img_size, is_edit, image_inputs
+        )
+        cached = self._get_cached_generation(cache_key)
+        if cached is not None:
+            return cached[0], {"total_cost": 0.0}
+
+        # The same user's identical request arriving while one is still running shares its API call
+        task = self._inflight_generations.get(cache_key)
+        if task is not None:
+            logger.info("Joining in-flight image generation %s", cache_key[:12])
+            result_urls, _ = await asyncio.shield(task)
+            return result_urls, {"total_cost": 0.0}
+        task = asyncio.create_task(self.generate_image(img_prompt, img_quality, img_size, model, image_inputs, is_edit))
+        self._inflight_generations[cache_key] = task
+        task.add_done_callback(lambda _: self._inflight_generations.pop(cache_key, None))
+        # Shielded so a cancelled first caller doesn't cancel the call the others are waiting on
+        result_urls, usage_info = await asyncio.shield(task)
+        self._store_generation(cache_key, result_urls, usage_info)
+        return result_urls, usage_info
+
+    def _get_cached_input(self, key: tuple) -> Optional[bytes]:
+        """Bytes of a recently downloaded source image, or None if missing or expired"""
+        entry = self._input_image_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, data = entry
+        if time.monotonic() - stored_at > _INPUT_CACHE_TTL:
+            del self._input_image_cache[key]
+            return None
+        self._input_image_cache.move_to_end(key)
+        return data
+
+    def _cache_input(self, key: tuple, data: bytes):
+        """Remember a downloaded source image, evicting the least recently used entry"""
+        if len(data) > _INPUT_CACHE_MAX_BYTES:
+            return
+        self._input_image_cache[key] = (time.monotonic(), data)
+        self._input_image_cache.move_to_end(key)
+        if len(self._input_image_cache) > _INPUT_CACHE_SIZE:
+            self._input_image_cache.popitem(last=False)
+
     def calculate_image_cost(self, model: str, size: str, quality: str = "high", is_edit: bool = False) -> float:
         """Calculate the cost of image generation based on model and parameters"""
-        if model == "gemini-2.5-flash-image":
-            # Gemini 2.5 Flash Image costs approximately $0.039 per image
-            return 0.039
-        elif model == "gemini-3-pro-image-preview":
-            # Gemini 3 Pro Image - premium pricing
-            return 0.08
-        elif model == "gpt-5-image-mini":
-            # GPT-5 Image Mini - lower cost option
-            base_cost = 0.08 if quality == "high" else 0.04
-            if is_edit:
-                return base_cost * 1.3
-            return base_cost
-        elif model == "gpt-5-image":
-            # GPT-5 Image - premium pricing
-            base_cost = 0.20 if quality == "high" else 0.10
-            if is_edit:
-                return base_cost * 1.3
-            return base_cost
-        return 0.05  # Default fallback
+        pricing = _IMAGE_COSTS.get(model)
+        if pricing is None:
+            return _DEFAULT_IMAGE_COST
+        high_cost, other_cost, edit_multiplier = pricing
+        base_cost = high_cost if quality == "high" else other_cost
+        return base_cost * edit_multiplier if is_edit else base_cost
         
     def extract_usage_info(self, response) -> dict:
         """Extract usage/cost information from API response"""
         usage_info = {}
         
         # Check for usage in main response
-        if hasattr(response, 'usage'):
-            usage = response.usage
-            logger.info(f"Found usage info: {usage}")
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            logger.info("Found usage info: %s", usage)
             
-            # Extract common usage fields
-            if hasattr(usage, 'total_tokens'):
-                usage_info['total_tokens'] = usage.total_tokens
-            if hasattr(usage, 'prompt_tokens'):
-                usage_info['prompt_tokens'] = usage.prompt_tokens
-            if hasattr(usage, 'completion_tokens'):
-                usage_info['completion_tokens'] = usage.completion_tokens
-            if hasattr(usage, 'total_cost'):
-                usage_info['total_cost'] = usage.total_cost
+            # Snapshot the usage object once, then pick the common fields out of it
+            fields = _usage_fields(usage)
+            for key in ('total_tokens', 'prompt_tokens', 'completion_tokens', 'total_cost'):
+                if key in fields:
+                    usage_info[key] = fields[key]
                 
         # Check for usage in data items
-        if hasattr(response, 'data') and response.data:
-            for data in response.data:
-                if hasattr(data, 'usage'):
-                    usage_info.update(vars(data.usage))
+        for data in getattr(response, 'data', None) or ():
+            data_usage = getattr(data, 'usage', None)
+            if data_usage is not None:
+                usage_info.update(_usage_fields(data_usage))
                     
         return usage_info
     
     def build_footer(self, model: str, quality: str, size: str, is_edit: bool = False, image_inputs: list = None, cost: float = 0, cost_source: str = "estimated", generation_time: float = 0, usage_info: dict = None) -> str:
         """Build standardized footer for image generation"""
-        # First line: Model name with modifiers
-        footer_parts = []
-
-        # Model name
-        if model == "gemini-2.5-flash-image":
-            footer_parts.append("Gemini 2.5 Flash Image")
-        elif model == "gemini-3-pro-image-preview":
-            footer_parts.append("Gemini 3 Pro Image")
-        elif model == "gpt-5-image-mini":
-            footer_parts.append("GPT-5 Image Mini")
-        elif model == "gpt-5-image":
-            footer_parts.append("GPT-5 Image")
-        else:
-            footer_parts.append(model)
-
-        # Quality (only for GPT models)
-        if model in ["gpt-5-image-mini", "gpt-5-image"]:
-            if quality in ("high", "hd"):
-                footer_parts.append("High Quality")
-            elif quality in ("standard", "medium", "low"):
-                footer_parts.append("Low Quality")
-
-        # Orientation (only for GPT models)
-        if model in ["gpt-5-image-mini", "gpt-5-image"]:
-            if size == "1536x1024" or size == "1792x1024":
-                footer_parts.append("Landscape")
-            elif size == "1024x1536" or size == "1024x1792":
-                footer_parts.append("Portrait")
-            elif size == "1024x1024":
-                footer_parts.append("Square")
-        
-        # Mode (if using input images)
-        if image_inputs:
-            mode_text = "Edit" if is_edit else "Input"
-            footer_parts.append(mode_text)
-            if len(image_inputs) > 1:
-                footer_parts.append(f"{len(image_inputs)} images")
-        
-        first_line = " | ".join(footer_parts)
-        
-        # Second line: Usage stats (standardized format)
-        usage_parts = []
-        
-        # Token usage (if available from usage_info) - rare for image generation
-        if usage_info:
-            if 'prompt_tokens' in usage_info and usage_info['prompt_tokens'] > 0:
-                input_tokens = usage_info['prompt_tokens']
-                if input_tokens >= 1000:
-                    input_str = f"{input_tokens / 1000:.1f}k"
-                else:
-                    input_str = str(input_tokens)
-                usage_parts.append(f"{input_str} input tokens")
-            if 'completion_tokens' in usage_info and usage_info['completion_tokens'] > 0:
-                output_tokens = usage_info['completion_tokens']
-                if output_tokens >= 1000:
-                    output_str = f"{output_tokens / 1000:.1f}k"
-                else:
-                    output_str = str(output_tokens)
-                usage_parts.append(f"{output_str} output tokens")
-        
-        # Cost (show $x.xx, but to first non-zero digit if under $0.01)
-        if cost >= 0.01:
-            cost_str = f"${cost:.2f}"
-        elif cost > 0:
-            # Find first non-zero digit
-            decimal_places = 2
-            while cost < (1 / (10 ** decimal_places)) and decimal_places < 10:
-                decimal_places += 1
-            cost_str = f"${cost:.{decimal_places}f}"
-        else:
-            cost_str = "$0.00"
-        usage_parts.append(cost_str)
-        
-        # Time
-        if generation_time > 0:
-            usage_parts.append(f"{generation_time} seconds")
-        
-        second_line = " | ".join(usage_parts)
-        
-        return f"{first_line}\n{second_line}"
+        # Reduce the arguments to the hashable scalars the footer text depends on, so repeats are cache hits
+        usage_info = usage_info or {}
+        return _format_footer(
+            model, quality, size, is_edit,
+            len(image_inputs) if image_inputs else 0,
+            cost, generation_time,
+            usage_info.get('prompt_tokens') or 0,
+            usage_info.get('completion_tokens') or 0,
+        )
 
     async def generate_image_streaming(self, img_prompt: str, img_quality: str, img_size: str, model: str = "gpt-5-image-mini", image_inputs: list = None, is_edit: bool = False, interaction=None):
         """Generate image with streaming support using Responses API"""
-        if model not in ["gpt-5-image-mini", "gpt-5-image"]:
+        if model not in _GPT_IMAGE_MODELS:
             # Fallback to regular generation for non-streaming models
             return await self.generate_image(img_prompt, img_quality, img_size, model, image_inputs, is_edit)
         
@@ -180,24 +555,10 @@ class ImageGen(commands.Cog):
         
         # Add input images if provided
         if image_inputs:
-            for image_input in image_inputs:
-                # Convert BytesIO to base64
-                image_input.seek(0)
-                image_bytes = image_input.read()
-                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-                
-                # Determine MIME type from filename
-                filename = getattr(image_input, 'name', 'image.png').lower()
-                if filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                    mime_type = 'image/jpeg'
-                elif filename.endswith('.webp'):
-                    mime_type = 'image/webp'
-                else:
-                    mime_type = 'image/png'
-                
+            for image_url in await _encode_images(image_inputs):
                 input_content.append({
                     "type": "input_image",
-                    "image_url": f"data:{mime_type};base64,{image_base64}"
+                    "image_url": image_url
                 })
         
         # Prepare tools configuration
@@ -209,66 +570,112 @@ class ImageGen(commands.Cog):
         }]
         
         # Create streaming response
-        stream = await asyncio.to_thread(
-            lambda: client.responses.create(
-                model="gpt-4o",  # Use supported model for Responses API
-                input=[{
-                    "role": "user",
-                    "content": input_content
-                }],
-                tools=tools,
-                stream=True
-            )
+        await self._request_bucket.acquire()
+        stream = await client.responses.create(
+            model="gpt-4o",  # Use supported model for Responses API
+            input=[{
+                "role": "user",
+                "content": input_content
+            }],
+            tools=tools,
+            stream=True
         )
         
+        # Truncated prompt shown in every streaming embed
+        display_prompt = img_prompt[:100] + ('...' if len(img_prompt) > 100 else '')
+        
         # Track partial images and the single message
         partial_images = {}
+        latest_idx = -1
         stream_message = None
+        # Latest partial waiting to be shown; bursts of partials collapse into one edit
+        pending_partial = None
+        flush_task = None
+        last_partial = None
+        # Partial currently attached to stream_message, so the final edit can skip re-uploading it
+        shown_partial = None
+        last_edit = 0.0
+        # One embed reused for every partial; only the step text changes. Partials use the final
+        # filename so an already-attached last partial can stay in place when generation completes
+        embed = discord.Embed(title="Generating...", color=_EMBED_COLOR)
+        embed.set_image(url="attachment://generated_image.png")
+
+        async def flush_partial():
+            nonlocal stream_message, shown_partial, last_edit
+            while True:
+                # Edit right away unless the previous edit was too recent
+                delay = last_edit + _PARTIAL_EDIT_DEBOUNCE - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                flushing = pending_partial
+                idx, file = flushing
+                try:
+                    await stream_message.edit(embed=embed, attachments=[file])
+                    shown_partial = partial_images[idx]
+                    logger.info(f"Updated streaming message with partial {idx}")
+                except (discord.NotFound, discord.Forbidden, discord.HTTPException) as e:
+                    logger.warning(f"Could not update streaming message with partial {idx}: {e}")
+                    # Fallback: send new message. This runs in a background task, so a failure is
+                    # logged here rather than left on a task nobody awaits
+                    try:
+                        stream_message = await interaction.followup.send(file=file, embed=embed)
+                        shown_partial = partial_images[idx]
+                    except Exception:
+                        logger.exception(f"Could not send replacement streaming message for partial {idx}")
+                last_edit = time.monotonic()
+                # A partial that arrived during the edit gets its own (throttled) edit
+                if pending_partial is flushing:
+                    return
         
         # Process streaming events as they arrive
-        for event in stream:
+        async for event in stream:
             if event.type == "response.image_generation_call.partial_image":
                 idx = event.partial_image_index
                 image_base64 = event.partial_image_b64
                 
                 logger.info(f"Received partial image {idx}")
                 
-                # Store partial image
-                partial_images[idx] = image_base64
+                # Store the decoded partial once; it is reused for the final edit and the return value
+                partial_images[idx] = _b64decode(image_base64)
+                if idx > latest_idx:
+                    latest_idx = idx
                 
-                # Create Discord file and embed
-                image_data = base64.b64decode(image_base64)
-                file = discord.File(io.BytesIO(image_data), filename=f"generating_image.png")
+                # Nothing new to show if the model resent the same image
+                if partial_images[idx] == last_partial:
+                    logger.info(f"Partial image {idx} is identical to the previous one, skipping update")
+                    continue
+                last_partial = partial_images[idx]
                 
-                embed = discord.Embed(
-                    title="Generating...", 
-                    description=f"**Step {idx+1}**\n{img_prompt[:100]}{'...' if len(img_prompt) > 100 else ''}", 
-                    color=0x32a956
-                )
-                embed.set_image(url=f"attachment://generating_image.png")
+                # Create Discord file and update the shared embed
+                file = discord.File(io.BytesIO(partial_images[idx]), filename="generated_image.png")
+                
+                embed.description = f"**Step {idx+1}**\n{display_prompt}"
                 embed.set_footer(text=f"{model} | Streaming | Step {idx+1}")
                 
                 if stream_message is None:
                     # Send initial message
                     stream_message = await interaction.followup.send(file=file, embed=embed)
+                    shown_partial = partial_images[idx]
+                    last_edit = time.monotonic()
                     logger.info(f"Sent initial streaming message for partial {idx}")
                 else:
-                    # Edit existing message with new partial
-                    try:
-                        await stream_message.edit(embed=embed, attachments=[file])
-                        logger.info(f"Updated streaming message with partial {idx}")
-                    except (discord.NotFound, discord.Forbidden, discord.HTTPException) as e:
-                        logger.warning(f"Could not update streaming message with partial {idx}: {e}")
-                        # Fallback: send new message
-                        stream_message = await interaction.followup.send(file=file, embed=embed)
-                
-                # Yield control to allow other async operations
-                await asyncio.sleep(0)
+                    # Edit existing message with new partial, throttled so a burst costs one API call
+                    pending_partial = (idx, file)
+                    if flush_task is None or flush_task.done():
+                        flush_task = asyncio.create_task(flush_partial())
             
             elif event.type == "response.image_generation_call.completed":
                 logger.info("Image generation completed - using latest partial image as final result")
                 break
         
+        # The final edit below supersedes any partial still waiting to be shown
+        if flush_task and not flush_task.done():
+            flush_task.cancel()
+            try:
+                await flush_task
+            except asyncio.CancelledError:
+                pass
+        
         # Calculate cost for streaming (since no usage info is returned)
         cost = self.calculate_image_cost(model, img_size, img_quality, is_edit)
         
@@ -294,21 +701,21 @@ class ImageGen(commands.Cog):
                     # Update title to show completion
                     final_embed.title = "Generated"
                     # Update description to remove "Step X" 
-                    final_embed.description = img_prompt[:100] + ('...' if len(img_prompt) > 100 else '')
+                    final_embed.description = display_prompt
                     # Update footer to remove streaming indicators
                     final_embed.set_footer(text=footer_text)
+                    # The stored embed still points at the first partial's CDN URL, which later
+                    # attachment edits deleted; point it back at the attached file
+                    final_embed.set_image(url="attachment://generated_image.png")
                     
-                    # Use the latest partial image for the final version
-                    if partial_images:
-                        latest_idx = max(partial_images.keys())
-                        latest_image_data = base64.b64decode(partial_images[latest_idx])
-                        final_file = discord.File(io.BytesIO(latest_image_data), filename="generated_image.png")
-                        final_embed.set_image(url="attachment://generated_image.png")
+                    # Use the latest partial image for the final version, uploading it only if it isn't already shown
+                    if latest_idx >= 0 and partial_images[latest_idx] is not shown_partial:
+                        final_file = discord.File(io.BytesIO(partial_images[latest_idx]), filename="generated_image.png")
                         
                         await stream_message.edit(embed=final_embed, attachments=[final_file])
                         logger.info(f"Updated streaming message to show final completion")
                     else:
-                        # Just update the embed without new attachment
+                        # Just update the embed, keeping the attachment already on the message
                         await stream_message.edit(embed=final_embed)
                         logger.info(f"Updated streaming message embed to show completion")
                         
@@ -323,10 +730,9 @@ class ImageGen(commands.Cog):
             else:
                 logger.warning(f"Failed to track streaming image generation usage for user {user_id}")
         
-        # Return the latest partial image data
-        if partial_images:
-            latest_partial = partial_images[max(partial_images.keys())]
-            return [f"data:image/png;base64,{latest_partial}"], {"total_cost": cost}
+        # Return the latest partial image as raw bytes
+        if latest_idx >= 0:
+            return [partial_images[latest_idx]], {"total_cost": cost}
             
         return [], {"total_cost": cost}
 
@@ -341,43 +747,31 @@ class ImageGen(commands.Cog):
         logger.info("Entering generate_image function (COG) with prompt: '%s', quality: '%s', size: '%s', model: '%s', is_edit: %s, num_input_images: %d",
                     img_prompt, img_quality, img_size, model, is_edit, num_images)
 
-        loop = asyncio.get_running_loop()
+        await self._request_bucket.acquire()
 
         # All models now go through OpenRouter
         client = self.openrouter_client
 
         # Map model names to OpenRouter API model names
-        if model == "gemini-2.5-flash-image":
-            api_model = "google/gemini-2.5-flash-image"
-        elif model == "gemini-3-pro-image-preview":
-            api_model = "google/gemini-3-pro-image-preview"
-        elif model == "gpt-5-image-mini":
-            api_model = "openai/gpt-5-image-mini"
-        elif model == "gpt-5-image":
-            api_model = "openai/gpt-5-image"
-        else:
-            api_model = model
+        api_model = _OPENROUTER_MODEL_IDS.get(model, model)
 
-        if image_inputs and is_edit and model in ["gpt-5-image-mini", "gpt-5-image"]:
+        if image_inputs and is_edit and model in _GPT_IMAGE_MODELS:
             # Image editing with GPT models - use first image for editing
             primary_image = image_inputs[0]
             logger.info(f"Calling image edit with filename: {getattr(primary_image, 'name', 'unknown')}")
             if num_images > 1:
                 logger.warning(f"{model} edit mode only supports 1 image, ignoring {num_images - 1} additional images")
-            response = await loop.run_in_executor(
-                None,
-                lambda: client.images.edit(
-                    model=api_model,
-                    image=primary_image,
-                    prompt=img_prompt,
-                    size=img_size,
-                    quality=img_quality,
-                    n=1,
-                )
+            response = await client.images.edit(
+                model=api_model,
+                image=_upload_file(primary_image),
+                prompt=img_prompt,
+                size=img_size,
+                quality=img_quality,
+                n=1,
             )
         else:
             # Image generation (with or without image input)
-            if model in ["gpt-5-image-mini", "gpt-5-image"]:
+            if model in _GPT_IMAGE_MODELS:
                 # GPT-5 Image models support using images as input for generation via the edit endpoint
                 if image_inputs:
                     # Log input images being used
@@ -386,117 +780,95 @@ class ImageGen(commands.Cog):
 
                     # For GPT models with input images, use the edit endpoint even for "input" mode
                     # This allows the model to use the images as references for generation
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: client.images.edit(
-                            model=api_model,
-                            image=image_inputs,  # Pass all input images
-                            prompt=img_prompt,
-                            size=img_size,
-                            quality=img_quality,
-                            n=1,
-                        )
+                    response = await client.images.edit(
+                        model=api_model,
+                        image=[_upload_file(image_input) for image_input in image_inputs],  # Pass all input images
+                        prompt=img_prompt,
+                        size=img_size,
+                        quality=img_quality,
+                        n=1,
                     )
                 else:
                     # No input images - standard generation
-                    response = await loop.run_in_executor(
-                        None,
-                        lambda: client.images.generate(
-                            model=api_model,
-                            prompt=img_prompt,
-                            size=img_size,
-                            quality=img_quality,
-                            n=1,
-                        )
+                    response = await client.images.generate(
+                        model=api_model,
+                        prompt=img_prompt,
+                        size=img_size,
+                        quality=img_quality,
+                        n=1,
                     )
-            elif model in ["gemini-2.5-flash-image", "gemini-3-pro-image-preview"]:
+            elif model in _GEMINI_IMAGE_MODELS:
                 # Gemini models using OpenRouter's OpenAI-compatible API
                 # Build message content with image inputs if provided
                 if image_inputs:
                     # Include input images in the message
                     content_parts = [{"type": "text", "text": img_prompt}]
-                    for img_input in image_inputs:
-                        img_input.seek(0)
-                        img_bytes = img_input.read()
-                        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                        # Determine MIME type
-                        filename = getattr(img_input, 'name', 'image.png').lower()
-                        if filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                            mime_type = 'image/jpeg'
-                        elif filename.endswith('.webp'):
-                            mime_type = 'image/webp'
-                        else:
-                            mime_type = 'image/png'
+                    for image_url in await _encode_images(image_inputs):
                         content_parts.append({
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:{mime_type};base64,{img_base64}"
+                                "url": image_url
                             }
                         })
                     message_content = content_parts
                 else:
                     message_content = img_prompt
 
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: client.chat.completions.create(
-                        model=api_model,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": message_content
-                            }
-                        ],
-                        modalities=["image", "text"],  # Request image generation
-                        max_tokens=1500  # Each image is about 1290 tokens
-                    )
+                response = await client.chat.completions.create(
+                    model=api_model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": message_content
+                        }
+                    ],
+                    modalities=["image", "text"],  # Request image generation
+                    max_tokens=1500  # Each image is about 1290 tokens
                 )
             else:
                 # Fallback for any other models
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: client.images.generate(
-                        model=api_model,
-                        prompt=img_prompt,
-                        size=img_size,
-                        quality=img_quality,
-                        n=1,
-                    )
+                response = await client.images.generate(
+                    model=api_model,
+                    prompt=img_prompt,
+                    size=img_size,
+                    quality=img_quality,
+                    n=1,
                 )
         
-        # Debug response structure and look for cost/usage info
-        logger.info(f"Full response object: {response}")
-        logger.info(f"Response type: {type(response)}")
-        logger.info(f"Response attributes: {dir(response)}")
-        
-        # Check for usage information
-        if hasattr(response, 'usage'):
-            logger.info(f"USAGE INFO FOUND: {response.usage}")
-            logger.info(f"Usage type: {type(response.usage)}")
-            logger.info(f"Usage attributes: {dir(response.usage)}")
-        else:
-            logger.info("No 'usage' attribute found in response")
+        # Debug response structure and look for cost/usage info (the dumps are large, so only when debugging)
+        # The response and its data items are not printed whole: they carry the base64 image payloads
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response type: %s", type(response))
+            logger.debug("Response attributes: %s", dir(response))
             
-        # Look for any cost-related attributes
-        cost_attrs = [attr for attr in dir(response) if 'cost' in attr.lower() or 'price' in attr.lower() or 'usage' in attr.lower() or 'token' in attr.lower()]
-        logger.info(f"Cost/usage related attributes: {cost_attrs}")
-        
-        if hasattr(response, 'data'):
-            logger.info(f"Response data: {response.data}")
-            logger.info(f"Data type: {type(response.data)}")
-            if response.data:
-                for i, data in enumerate(response.data):
-                    logger.info(f"Data item {i}: {data}")
-                    logger.info(f"Data item {i} type: {type(data)}")
-                    logger.info(f"Data item {i} attributes: {dir(data)}")
-                    
-                    # Check data items for usage info
-                    if hasattr(data, 'usage'):
-                        logger.info(f"Data item {i} usage: {data.usage}")
+            # Check for usage information
+            if hasattr(response, 'usage'):
+                logger.debug("USAGE INFO FOUND: %s", response.usage)
+                logger.debug("Usage type: %s", type(response.usage))
+                logger.debug("Usage attributes: %s", dir(response.usage))
+            else:
+                logger.debug("No 'usage' attribute found in response")
+                
+            # Look for any cost-related attributes
+            cost_attrs = [attr for attr in dir(response) if 'cost' in attr.lower() or 'price' in attr.lower() or 'usage' in attr.lower() or 'token' in attr.lower()]
+            logger.debug("Cost/usage related attributes: %s", cost_attrs)
+            
+            if hasattr(response, 'data'):
+                logger.debug("Data type: %s", type(response.data))
+                if response.data:
+                    for i, data in enumerate(response.data):
+                        b64_json = getattr(data, 'b64_json', None)
+                        logger.debug("Data item %d: url=%s b64_json chars=%d", i, getattr(data, 'url', None), len(b64_json) if b64_json else 0)
+                        logger.debug("Data item %d type: %s", i, type(data))
+                        logger.debug("Data item %d attributes: %s", i, dir(data))
+                        
+                        # Check data items for usage info
+                        if hasattr(data, 'usage'):
+                            logger.debug("Data item %d usage: %s", i, data.usage)
 
         # Handle different response formats
         image_urls = []
-        if model in ["gemini-2.5-flash-image", "gemini-3-pro-image-preview"]:
+        if model in _GEMINI_IMAGE_MODELS:
             # Handle Gemini chat completion response with image
             if hasattr(response, 'choices') and response.choices:
                 for choice in response.choices:
@@ -521,15 +893,10 @@ class ImageGen(commands.Cog):
                                             image_urls.append(url)
                         elif isinstance(content, str):
                             # Extract image URLs from markdown format ![](url)
-                            import re
-                            image_pattern = r'!\[.*?\]\((.*?)\)'
-                            matches = re.findall(image_pattern, content)
-                            image_urls.extend(matches)
+                            image_urls.extend(_MARKDOWN_IMAGE_RE.findall(content))
 
                             # Look for data URLs directly in the text
-                            data_url_pattern = r'data:image/[^;]+;base64,[A-Za-z0-9+/=]+'
-                            data_matches = re.findall(data_url_pattern, content)
-                            image_urls.extend(data_matches)
+                            image_urls.extend(_DATA_URL_RE.findall(content))
 
                             # If content itself is a data URL
                             if content.startswith('data:image'):
@@ -539,12 +906,14 @@ class ImageGen(commands.Cog):
                 if hasattr(data, 'url') and data.url:
                     image_urls.append(data.url)
                 elif hasattr(data, 'b64_json') and data.b64_json:
-                    # GPT models might return base64 instead of URL
-                    image_urls.append(f"data:image/png;base64,{data.b64_json}")
+                    # GPT models might return base64 instead of URL; decode once to raw bytes,
+                    # which _load_result_image wraps directly instead of round-tripping a data URL
+                    image_urls.append(_b64decode(data.b64_json))
                 else:
                     logger.warning(f"Unexpected data format in response: {data}")
         
-        logger.info("Generated image URL(s): %s", image_urls)
+        logger.info("Generated image URL(s): %s", ", ".join(
+            f"<{len(url)} bytes>" if isinstance(url, bytes) else str(_Truncated(url, 100)) for url in image_urls))
         if not image_urls:
             logger.error(f"No valid image URLs found in response: {response}")
             raise Exception("No image URLs returned from API")
@@ -555,6 +924,19 @@ class ImageGen(commands.Cog):
         
         return image_urls, usage_info
 
+    async def _check_quota(self, interaction: discord.Interaction, user_id: str, estimated_cost: float, num_input_images: int, cost_msg: str) -> bool:
+        """Tell the user and return False if their remaining quota can't cover the estimated cost"""
+        remaining_quota = quota_manager.get_remaining_quota(user_id)
+        if remaining_quota == 0:
+            error_embed = create_error_embed("You've reached your monthly usage limit. Your quota resets at the beginning of each month.")
+            await interaction.followup.send(embed=error_embed)
+            return False
+        if remaining_quota != float('inf') and remaining_quota < estimated_cost:
+            input_text = f"{num_input_images} input images" if num_input_images > 0 else "no input images"
+            await interaction.followup.send(f"⚠️ **Low Quota**: You have ${remaining_quota:.4f} remaining this month. Image generation with {input_text} typically costs {cost_msg}.")
+            return False
+        return True
+
     def _is_admin(self, user_id: int) -> bool:
         """Check if user is an admin"""
         admin_ids_str = os.getenv("BOT_ADMIN_IDS", "")
@@ -614,44 +996,17 @@ class ImageGen(commands.Cog):
         user_id_int = interaction.user.id
 
         # Check if model is admin-only
-        admin_only_models = ["gemini-3-pro-image-preview", "gpt-5-image"]
-        if model in admin_only_models and not self._is_admin(user_id_int):
+        if model in _ADMIN_ONLY_MODELS and not self._is_admin(user_id_int):
             from utils.embed_utils import create_error_embed
             error_embed = create_error_embed(f"The model '{model}' is only available to administrators.")
             await interaction.followup.send(embed=error_embed)
             return
 
-        # Map quality parameter to API format
-        if model in ["gemini-2.5-flash-image", "gemini-3-pro-image-preview"]:
-            # Gemini uses standard quality strings
-            api_quality = "high" if quality == "high" else "standard"
-        elif model in ["gpt-5-image-mini", "gpt-5-image"]:
-            # Two-tier mapping: low → medium, high → high
-            api_quality = "high" if quality == "high" else "medium"
-        else:
-            # Fallback
-            api_quality = "high" if quality == "high" else "standard"
-
-        # Different size support for different models
-        if model in ["gemini-2.5-flash-image", "gemini-3-pro-image-preview"]:
-            # Gemini supports: 1024x1024, 1536x1024, 1024x1536
-            if orientation == "Landscape":
-                size = "1536x1024"
-            elif orientation == "Portrait":
-                size = "1024x1536"
-            else:
-                size = "1024x1024"
-        elif model in ["gpt-5-image-mini", "gpt-5-image"]:
-            # GPT-5 Image models support: 1024x1024, 1024x1536, 1536x1024, auto
-            if orientation == "Landscape":
-                size = "1536x1024"
-            elif orientation == "Portrait":
-                size = "1024x1536"
-            else:
-                size = "1024x1024"
-        else:
-            # Fallback
-            size = "1024x1024"
+        # Map quality parameter to API format (GPT: low → medium, others: low → standard)
+        api_quality = "high" if quality == "high" else _LOW_QUALITY_BY_MODEL.get(model, "standard")
+
+        # Map orientation to a supported size, falling back to square
+        size = _ORIENTATION_SIZES.get(orientation, "1024x1024")
 
         image_inputs = []
         is_edit = False
@@ -661,22 +1016,16 @@ class ImageGen(commands.Cog):
         attachments = [att for att in attachments if att is not None]  # Filter out None values
 
         try:
-            for attachment in attachments:
-                if attachment.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                    try:
-                        image_bytes = await attachment.read()
-                        image_input = io.BytesIO(image_bytes)
-                        # Set the name attribute so OpenAI can determine the file type
-                        image_input.name = attachment.filename
-                        image_inputs.append(image_input)
-                        is_edit = (image_mode == "edit")
-                    except Exception as e:
-                        logger.error(f"Error reading attachment: {e}")
-                        await interaction.followup.send("Error reading image attachment. Please try again.")
-                        return
-                else:
-                    await interaction.followup.send("Please attach a valid image file (PNG, JPG, JPEG, or WebP).")
-                    return
+            if any(not is_image_filename(attachment.filename, _IMAGE_EXTS) for attachment in attachments):
+                await interaction.followup.send("Please attach a valid image file (PNG, JPG, JPEG, or WebP).")
+                return
+
+            # Download all attachments concurrently through the same cached reader the edit modal uses
+            image_inputs = await asyncio.gather(*(self._read_attachment_image(attachment) for attachment in attachments))
+            if any(image_input is None for image_input in image_inputs):
+                await interaction.followup.send("Error reading image attachment. Please try again.")
+                return
+            is_edit = bool(image_inputs) and image_mode == "edit"
             
         except Exception as e:
             logger.error(f"Error processing attachments: {e}")
@@ -686,32 +1035,23 @@ class ImageGen(commands.Cog):
             logger.info(f"Processing {len(image_inputs)} images for generation")
 
         # Check user quota before generating image (after collecting images for better cost estimation)
-        remaining_quota = quota_manager.get_remaining_quota(user_id)
         num_input_images = len(image_inputs)
         
         # Estimate cost based on quality and multi-image operations
-        base_cost = 0.20 if quality == "high" else 0.06
-        estimated_cost = base_cost * 1.5 if num_input_images > 1 else base_cost
-        
-        if remaining_quota == 0:
-            error_embed = create_error_embed("You've reached your monthly usage limit. Your quota resets at the beginning of each month.")
-            await interaction.followup.send(embed=error_embed)
-            return
-        elif remaining_quota != float('inf') and remaining_quota < estimated_cost:
-            cost_msg = f"${estimated_cost:.2f}" if num_input_images > 1 else "$0.04-$0.08"
-            input_text = f"{num_input_images} input images" if num_input_images > 0 else "no input images"
-            await interaction.followup.send(f"⚠️ **Low Quota**: You have ${remaining_quota:.4f} remaining this month. Image generation with {input_text} typically costs {cost_msg}.")
+        estimated_cost = _ESTIMATED_GEN_COSTS[("high" if quality == "high" else "low", num_input_images > 1)]
+        cost_msg = f"${estimated_cost:.2f}" if num_input_images > 1 else "$0.04-$0.08"
+        if not await self._check_quota(interaction, user_id, estimated_cost, num_input_images, cost_msg):
             return
 
         try:
             # Use streaming if enabled and model supports it
-            if streaming and model in ["gpt-5-image-mini", "gpt-5-image"]:
+            if streaming and model in _GPT_IMAGE_MODELS:
                 result_urls, usage_info = await self.generate_image_streaming(
                     prompt, api_quality, size, model, image_inputs, is_edit, interaction
                 )
                 # Continue with normal flow to ensure image is properly sent
             else:
-                result_urls, usage_info = await self.generate_image(prompt, api_quality, size, model, image_inputs, is_edit)
+                result_urls, usage_info = await self._generate_with_cache(user_id, prompt, api_quality, size, model, image_inputs, is_edit)
         except Exception as e:
             logger.exception("Error generating image for prompt: '%s'", prompt)
             await interaction.followup.send(f"Error generating image: {e}")
@@ -748,36 +1088,7 @@ class ImageGen(commands.Cog):
         )
 
         # Process all images and combine into a single response
-        files = []
-        embeds = []
-        
-        for idx, url in enumerate(result_urls):
-            try:
-                if url.startswith("data:image/"):
-                    # Handle base64 data URLs
-                    base64_data = url.split(",", 1)[1]
-                    image_data = base64.b64decode(base64_data)
-                else:
-                    # Handle regular URLs
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(url) as resp:
-                            if resp.status != 200:
-                                logger.error("Failed to fetch image from URL: %s", url)
-                                continue
-                            image_data = await resp.read()
-                            
-                file = discord.File(io.BytesIO(image_data), filename=f"generated_image_{idx}.png")
-                embed = discord.Embed(title="", description=prompt, color=0x32a956)
-                embed.set_image(url=f"attachment://generated_image_{idx}.png")
-                if idx == 0:  # Only add footer to first embed
-                    embed.set_footer(text=footer_text)
-                
-                files.append(file)
-                embeds.append(embed)
-                logger.info("Processed generated image for URL: %s", url[:50] + "..." if len(url) > 50 else url)
-            except Exception as e:
-                logger.exception("Error processing image from URL: %s", url)
-                continue
+        files, embeds = await self._materialize_results(result_urls, prompt, footer_text)
         
         if files:
             # Send all images in a single message
@@ -787,64 +1098,86 @@ class ImageGen(commands.Cog):
 
         logger.info("Image generation command completed in %s seconds", generation_time)
 
-    async def extract_images_from_message(self, message: discord.Message) -> list[io.BytesIO]:
-        """Extract all images from a message (attachments and embeds)"""
-        images = []
-        
-        # Check attachments first
-        for attachment in message.attachments:
-            if attachment.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                try:
-                    image_bytes = await attachment.read()
-                    image_bytesio = io.BytesIO(image_bytes)
-                    # Set the name attribute so OpenAI can determine the file type
-                    image_bytesio.name = attachment.filename
-                    images.append(image_bytesio)
-                    logger.info(f"Extracted attachment image: {attachment.filename}")
-                except Exception as e:
-                    logger.error(f"Error reading attachment: {e}")
-                    
-        # Check embeds for images
-        for i, embed in enumerate(message.embeds):
-            if embed.image:
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(embed.image.url) as resp:
-                            if resp.status == 200:
-                                image_bytes = await resp.read()
-                                image_bytesio = io.BytesIO(image_bytes)
-                                # Extract filename from URL or use default .png
-                                url = embed.image.url
-                                if url.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                                    # Extract extension from URL
-                                    extension = url.split('.')[-1].split('?')[0]  # Remove query params
-                                    image_bytesio.name = f"embed_image_{i}.{extension}"
-                                else:
-                                    image_bytesio.name = f"embed_image_{i}.png"  # Default to PNG
-                                images.append(image_bytesio)
-                                logger.info(f"Extracted embed image: {image_bytesio.name}")
-                except Exception as e:
-                    logger.error(f"Error downloading embed image: {e}")
+    async def _read_attachment_image(self, attachment: discord.Attachment) -> Optional[io.BytesIO]:
+        """Download one image attachment, returning None if it can't be read"""
+        cache_key = ("attachment", attachment.id)
+        image_bytes = self._get_cached_input(cache_key)
+        if image_bytes is None:
+            try:
+                image_bytes = await attachment.read()
+            except Exception as e:
+                logger.error(f"Error reading attachment: {e}")
+                return None
+            self._cache_input(cache_key, image_bytes)
+        # BytesIO shares the downloaded bytes (and the cache entry) rather than copying them
+        image_bytesio = io.BytesIO(image_bytes)
+        # Set the name attribute so OpenAI can determine the file type
+        image_bytesio.name = attachment.filename
+        logger.info(f"Extracted attachment image: {attachment.filename}")
+        return image_bytesio
+
+    async def _fetch_embed_image(self, i: int, embed: discord.Embed) -> Optional[io.BytesIO]:
+        """Download the image of one embed, returning None if it can't be fetched"""
+        cache_key = ("embed", embed.image.url)
+        cached = self._get_cached_input(cache_key)
+        if cached is not None:
+            image_bytesio = io.BytesIO(cached)
+        else:
+            try:
+                async with self._download_sem, self._get_http().get(embed.image.url) as resp:
+                    if resp.status != 200:
+                        return None
+                    image_bytesio = await self._read_image_body(resp)
+            except Exception as e:
+                logger.error(f"Error downloading embed image: {e}")
+                return None
+            self._cache_input(cache_key, image_bytesio.getvalue())
+        # Take the extension from the URL path (ignoring any query string) or default to .png
+        path = urlparse(embed.image.url).path
+        extension = path[path.rfind('.'):].lower()
+        if extension not in _IMAGE_EXTS:
+            extension = ".png"
+        image_bytesio.name = f"embed_image_{i}{extension}"
+        logger.info(f"Extracted embed image: {image_bytesio.name}")
+        return image_bytesio
+
+    async def extract_images_from_message(self, message: discord.Message, limit: Optional[int] = None) -> list[io.BytesIO]:
+        """Extract images from a message (attachments and embeds), stopping after `limit` if given"""
+        sources = [functools.partial(self._read_attachment_image, attachment)
+                   for attachment in message.attachments if is_image_filename(attachment.filename, _IMAGE_EXTS)]
+        sources += [functools.partial(self._fetch_embed_image, i, embed)
+                    for i, embed in enumerate(message.embeds) if embed.image]
+
+        if limit is not None:
+            # Fetch in order and stop early rather than downloading images that would be discarded
+            images = []
+            for source in sources:
+                image = await source()
+                if image is not None:
+                    images.append(image)
+                    if len(images) >= limit:
+                        break
+        else:
+            # Download attachments first, then embed images, all concurrently; task order keeps that order.
+            # The helpers turn expected failures into None, so anything escaping cancels the rest of the group.
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(source()) for source in sources]
+            images = [image for image in (task.result() for task in tasks) if image is not None]
                     
         logger.info(f"Extracted {len(images)} images from message")
         return images
     
     async def extract_image_from_message(self, message: discord.Message) -> Optional[io.BytesIO]:
         """Extract first image from a message (backwards compatibility)"""
-        images = await self.extract_images_from_message(message)
+        images = await self.extract_images_from_message(message, limit=1)
         return images[0] if images else None
 
 
 class ImageEditModal(discord.ui.Modal):
     def __init__(self, image_cog: ImageGen, original_message: discord.Message):
         # Count images to customize title
-        image_count = 0
-        for att in original_message.attachments:
-            if att.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                image_count += 1
-        for embed in original_message.embeds:
-            if embed.image:
-                image_count += 1
+        image_count = (sum(1 for att in original_message.attachments if is_image_filename(att.filename, _IMAGE_EXTS))
+                       + sum(1 for embed in original_message.embeds if embed.image))
         
         title = f'Generate with {image_count} Image{"s" if image_count > 1 else ""}'
         super().__init__(title=title)
@@ -907,7 +1240,6 @@ class ImageEditModal(discord.ui.Modal):
         model_str = "gemini-2.5-flash-image"  # Default to Gemini 2.5 Flash Image
 
         # Check user quota before generating image (after we know how many images)
-        remaining_quota = quota_manager.get_remaining_quota(user_id)
         num_input_images = len(image_inputs)
 
         # Use hardcoded defaults since fields are commented out
@@ -918,13 +1250,7 @@ class ImageEditModal(discord.ui.Modal):
         if num_input_images > 1:
             estimated_cost *= 1.5
 
-        if remaining_quota == 0:
-            error_embed = create_error_embed("You've reached your monthly usage limit. Your quota resets at the beginning of each month.")
-            await interaction.followup.send(embed=error_embed)
-            return
-        elif remaining_quota != float('inf') and remaining_quota < estimated_cost:
-            cost_msg = f"${estimated_cost:.2f}"
-            await interaction.followup.send(f"⚠️ **Low Quota**: You have ${remaining_quota:.4f} remaining this month. Image generation with {num_input_images} input images typically costs {cost_msg}.")
+        if not await self.image_cog._check_quota(interaction, user_id, estimated_cost, num_input_images, f"${estimated_cost:.2f}"):
             return
 
         start_time = time.time()
@@ -933,31 +1259,26 @@ class ImageEditModal(discord.ui.Modal):
         image_mode_str = "input"
 
         # Only GPT models support streaming
-        use_streaming = model_str in ["gpt-5-image-mini", "gpt-5-image"]
+        use_streaming = model_str in _GPT_IMAGE_MODELS
 
         # Map quality to API format
-        if model_str in ["gpt-5-image-mini", "gpt-5-image"]:
-            # Two-tier mapping: low → medium, high → high
-            api_quality = "high" if quality_str == "high" else "medium"
-        else:
-            # Gemini uses standard quality strings
-            api_quality = "high" if quality_str == "high" else "standard"
+        api_quality = "high" if quality_str == "high" else _LOW_QUALITY_BY_MODEL.get(model_str, "standard")
 
-        # Different size support for different models - all use 1024x1024 for Square
-        size = "1024x1024"
+        # Map orientation to a supported size, falling back to square
+        size = _ORIENTATION_SIZES.get(orientation_str, "1024x1024")
             
         is_edit = (image_mode_str == "edit")
             
         try:
             # Use streaming if enabled and model supports it
-            if use_streaming and model_str in ["gpt-5-image-mini", "gpt-5-image"]:
+            if use_streaming and model_str in _GPT_IMAGE_MODELS:
                 result_urls, usage_info = await self.image_cog.generate_image_streaming(
                     self.prompt.value, api_quality, size, model_str, image_inputs, is_edit, interaction
                 )
                 # Streaming already sends the final image, so we can return early
                 return
             else:
-                result_urls, usage_info = await self.image_cog.generate_image(self.prompt.value, api_quality, size, model_str, image_inputs, is_edit)
+                result_urls, usage_info = await self.image_cog._generate_with_cache(user_id, self.prompt.value, api_quality, size, model_str, image_inputs, is_edit)
         except Exception as e:
             logger.exception("Error generating image for prompt: '%s'", self.prompt.value)
             await interaction.followup.send(f"Error generating image: {e}")
@@ -994,36 +1315,7 @@ class ImageEditModal(discord.ui.Modal):
         )
         
         # Process all images and combine into a single response
-        files = []
-        embeds = []
-        
-        for idx, url in enumerate(result_urls):
-            try:
-                if url.startswith("data:image/"):
-                    # Handle base64 data URLs
-                    base64_data = url.split(",", 1)[1]
-                    image_data = base64.b64decode(base64_data)
-                else:
-                    # Handle regular URLs
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(url) as resp:
-                            if resp.status != 200:
-                                logger.error("Failed to fetch image from URL: %s", url)
-                                continue
-                            image_data = await resp.read()
-                            
-                file = discord.File(io.BytesIO(image_data), filename=f"generated_image_{idx}.png")
-                embed = discord.Embed(title="", description=self.prompt.value, color=0x32a956)
-                embed.set_image(url=f"attachment://generated_image_{idx}.png")
-                if idx == 0:  # Only add footer to first embed
-                    embed.set_footer(text=footer_text)
-                
-                files.append(file)
-                embeds.append(embed)
-                logger.info("Processed generated image for URL: %s", url[:50] + "..." if len(url) > 50 else url)
-            except Exception as e:
-                logger.exception("Error processing image from URL: %s", url)
-                continue
+        files, embeds = await self.image_cog._materialize_results(result_urls, self.prompt.value, footer_text)
         
         if files:
             # Send all images in a single message
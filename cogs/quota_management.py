@@ -1,3 +1,4 @@
+import asyncio
 import discord
 from discord.ext import commands
 from discord import app_commands
@@ -9,9 +10,30 @@ from config_manager import config
 
 logger = logging.getLogger(__name__)
 
+# Seconds between batched writes of recorded usage to the quota file
+_QUOTA_FLUSH_INTERVAL = 5
+
 class QuotaManagement(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.flush_task = None
+    
+    async def cog_load(self):
+        self.flush_task = asyncio.create_task(self.quota_flush_loop())
+    
+    async def cog_unload(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        quota_manager.flush()
+    
+    async def quota_flush_loop(self):
+        """Periodically persist usage so per-request accounting doesn't write the quota file every time"""
+        while True:
+            await asyncio.sleep(_QUOTA_FLUSH_INTERVAL)
+            try:
+                quota_manager.flush()
+            except Exception as e:
+                logger.error(f"Error flushing quota usage: {e}")
     
     def is_admin(self, user_id: int) -> bool:
         """Check if user is an admin using config manager"""
@@ -588,7 +588,7 @@ Provide:
 
             # Use the established API pattern
             # DO NOT CHANGE: Using Gemini 2.0 Flash for extraction
-            content, stats = await api_utils.send_request(
+            content, stats, _ = await api_utils.send_request(
                 model="google/gemini-2.0-flash-001",
                 message_content=extraction_prompt,
                 api="openrouter",
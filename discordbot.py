@@ -1,11 +1,13 @@
 import os
 import asyncio
 import logging
+import signal
 import discord
 from discord.ext import commands
 from conversation_handler import ConversationHandler, is_ai_conversation_thread, is_rpg_conversation_thread
 from config_manager import config
 from utils.conversation_db import conversation_db
+from utils.quota_validator import quota_manager
 
 logging.basicConfig(
     level=logging.INFO,
@@ -97,7 +99,19 @@ async def main():
         raise RuntimeError("Configuration validation failed")
     
     await load_cogs()
-    await bot.start(config.get_required('bot_token'))
+    
+    # docker stop sends SIGTERM, whose default handling skips atexit; close the bot instead so
+    # cogs unload cleanly and batched quota usage is written before the process exits
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass  # Signal handlers aren't supported by the Windows event loop
+    
+    try:
+        await bot.start(config.get_required('bot_token'))
+    finally:
+        quota_manager.flush()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
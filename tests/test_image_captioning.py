@@ -39,7 +39,7 @@ class TestImageCaptioning(unittest.TestCase):
         """Test that image captioning is triggered for unsupported models"""
         # Mock necessary components
         api_cog = Mock()
-        api_cog.send_request = AsyncMock(return_value=("This is a test image showing a cat.", {"total_cost": 0.001}))
+        api_cog.send_request = AsyncMock(return_value=("This is a test image showing a cat.", {"total_cost": 0.001}, None))
         
         self.bot.get_cog = Mock(return_value=api_cog)
         
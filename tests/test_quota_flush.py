@@ -0,0 +1,73 @@
+"""
+Test batched quota persistence: usage is kept in memory until flush() writes it
+"""
+import sys
+import os
+import json
+import tempfile
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.quota_validator import QuotaManager, QuotaValidator, quota_manager, quota_validator
+
+
+def _make_manager():
+    quota_file = os.path.join(tempfile.mkdtemp(), "user_quotas.json")
+    manager = QuotaManager(quota_file=quota_file)
+    manager.unlimited_user_ids = set()
+    return manager
+
+
+def _saved_usage(manager, user_id):
+    with open(manager.quota_file) as f:
+        return json.load(f)[user_id]["usage"].get(manager._get_current_month_key(), 0.0)
+
+
+def test_add_usage_marks_dirty_without_writing():
+    manager = _make_manager()
+    manager.get_user_quota("u1")  # Initializing the user writes the file once
+    
+    assert manager.add_usage("u1", 0.25)
+    assert manager._dirty
+    # Reads see the new total right away, the file does not until flush()
+    assert manager.get_user_usage("u1") == 0.25
+    assert _saved_usage(manager, "u1") == 0.0
+
+
+def test_flush_persists_usage_and_clears_dirty():
+    manager = _make_manager()
+    manager.add_usage("u1", 0.25)
+    manager.add_usage("u1", 0.5)
+    
+    manager.flush()
+    
+    assert not manager._dirty
+    assert _saved_usage(manager, "u1") == 0.75
+    # A fresh manager on the same file picks up the flushed usage
+    reloaded = QuotaManager(quota_file=manager.quota_file)
+    assert reloaded.get_user_usage("u1") == 0.75
+
+
+def test_flush_skips_write_when_clean():
+    manager = _make_manager()
+    manager.add_usage("u1", 0.1)
+    manager.flush()
+    
+    writes = []
+    manager._save_quotas = lambda: writes.append(True)
+    manager.flush()
+    
+    assert writes == []
+
+
+def test_validator_tracks_usage_on_the_flushed_manager():
+    assert quota_validator.quota_manager is quota_manager
+    
+    manager = _make_manager()
+    validator = QuotaValidator(manager)
+    assert validator.track_usage("u1", 0.2)
+    assert manager._dirty
+    
+    manager.flush()
+    assert _saved_usage(manager, "u1") == 0.2
@@ -4,7 +4,7 @@ Contains shared utility functions and classes used across the application
 """
 
 # Import main utility classes for easy access
-from .attachment_handler import process_attachments, validate_attachments, get_supported_file_types
+from .attachment_handler import process_attachments, validate_attachments, get_supported_file_types, is_image_filename, image_mime_type
 from .conversation_logger import ConversationLogger, conversation_logger
 from .quota_validator import QuotaValidator, quota_validator
 from .response_formatter import extract_footnotes, build_standardized_footer, format_usage_stats
@@ -16,6 +16,8 @@ __all__ = [
     'process_attachments',
     'validate_attachments', 
     'get_supported_file_types',
+    'is_image_filename',
+    'image_mime_type',
     
     # Conversation logging
     'ConversationLogger',
@@ -6,9 +6,25 @@ Handles file attachments and image processing
 import aiohttp
 import logging
 from typing import Tuple, List, Optional
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# MIME type of each image extension chat models accept
+IMAGE_MIME_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+# Attachment extensions chat models accept as images
+IMAGE_EXTENSIONS = frozenset(IMAGE_MIME_TYPES)
+
+# Attachment extensions process_attachments passes through as images
+_ATTACHMENT_IMAGE_EXTENSIONS = IMAGE_EXTENSIONS | {".bmp", ".tiff"}
+
 
 async def process_attachments(
     prompt: str, 
@@ -82,8 +98,20 @@ async def _read_text_attachment(attachment, is_slash: bool) -> Optional[str]:
 
 def _is_image_file(filename: str) -> bool:
     """Check if filename indicates an image file"""
-    image_extensions = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tiff")
-    return filename.endswith(image_extensions)
+    return is_image_filename(filename, _ATTACHMENT_IMAGE_EXTENSIONS)
+
+
+def is_image_filename(filename: str, extensions: frozenset = IMAGE_EXTENSIONS) -> bool:
+    """Check if a filename's extension (case-insensitive) is one of the given image extensions"""
+    # Only the suffix is lowercased; without a dot rfind gives -1, a 1-char suffix that never matches
+    return filename[filename.rfind('.'):].lower() in extensions
+
+
+def image_mime_type(url: str, default: str = "image/jpeg") -> str:
+    """Get the MIME type of an image URL from the extension of its path"""
+    # Discord CDN links end in signed ?ex=...&hm=... parameters, so the suffix must come from the path
+    path = urlparse(url).path
+    return IMAGE_MIME_TYPES.get(path[path.rfind('.'):].lower(), default)
 
 
 def get_supported_file_types() -> dict:
@@ -1,8 +1,8 @@
 import time
+import asyncio
 import logging
 import openai
 import discord
-import aiohttp
 import json
 import uuid
 import re
@@ -85,33 +85,40 @@ async def perform_chat_query_enhanced(
     start_time = time.time()
     original_prompt = request.prompt
 
-    ddg_summary = None
-    if duck_cog and request.web_search:
+    async def _apply_web_search():
+        ddg_summary = None
         try:
             search_query = await duck_cog.extract_search_query(original_prompt)
             if search_query:
                 ddg_summary = await duck_cog.perform_ddg_search(search_query)
                 if ddg_summary:
-                    summary_result = await duck_cog.summarize_search_results(ddg_summary)
-                    summary = summary_result[0] if isinstance(summary_result, tuple) else summary_result
+                    summary = await duck_cog.summarize_search_results(ddg_summary)
                     if summary:
                         request.prompt = original_prompt + "\n\nSummary of Relevant Web Search Results:\n" + summary
         except Exception as e:
             logger.exception("Error during DuckDuckGo search: %s", e)
 
-    if ddg_summary:
-        summary_text = ddg_summary[0] if isinstance(ddg_summary, tuple) else ddg_summary
-        request.prompt = original_prompt + "\n\nSummary of Relevant Web Search Results:\n" + summary_text
+        if ddg_summary:
+            request.prompt = original_prompt + "\n\nSummary of Relevant Web Search Results:\n" + ddg_summary
+
+    async def _get_time_prefix() -> str:
+        try:
+            user_timezone = await reminder_manager_v2.get_user_timezone(int(request.user_id))
+            local_tz = pytz.timezone(user_timezone)
+            current_local_time = datetime.now(local_tz)
+            return f"[Current time: {current_local_time.strftime('%Y-%m-%d %H:%M:%S %Z (%z)')}]\n\n"
+        except Exception as e:
+            logger.warning(f"Failed to add timezone context for user {request.user_id}: {e}")
+            return ""
+
+    # The web search pipeline and the timezone lookup are independent, so run them concurrently
+    if duck_cog and request.web_search:
+        _, time_prefix = await asyncio.gather(_apply_web_search(), _get_time_prefix())
+    else:
+        time_prefix = await _get_time_prefix()
 
     # Prepend user's current local time for LLM context
-    try:
-        user_timezone = await reminder_manager_v2.get_user_timezone(int(request.user_id))
-        local_tz = pytz.timezone(user_timezone)
-        current_local_time = datetime.now(local_tz)
-        time_prefix = f"[Current time: {current_local_time.strftime('%Y-%m-%d %H:%M:%S %Z (%z)')}]\n\n"
-        request.prompt = time_prefix + request.prompt
-    except Exception as e:
-        logger.warning(f"Failed to add timezone context for user {request.user_id}: {e}")
+    request.prompt = time_prefix + request.prompt
 
     # Check user quota before making API call
     can_proceed, quota_error = quota_validator.check_user_quota(request.user_id)
@@ -127,7 +134,7 @@ async def perform_chat_query_enhanced(
         ):
             with attempt:
                 try:
-                    result, stats = await api_cog.send_request(
+                    result, stats, _ = await api_cog.send_request(
                         model=request.api_config.model,
                         message_content=request.prompt,
                         reference_message=request.reference_message,
@@ -157,7 +164,7 @@ async def perform_chat_query_enhanced(
                             logger.warning(f"OpenRouter quota error: requested {request.api_config.max_tokens}, can afford {affordable_tokens}, retrying with {new_max_tokens}")
 
                             # Retry with reduced tokens
-                            result, stats = await api_cog.send_request(
+                            result, stats, _ = await api_cog.send_request(
                                 model=request.api_config.model,
                                 message_content=request.prompt,
                                 reference_message=request.reference_message,
@@ -385,24 +392,14 @@ async def perform_chat_query_with_tools_enhanced(
     # Add the user's message
     if request.image_url:
         content_list = [{"type": "text", "text": request.prompt}]
-        # Add image handling similar to send_request
+        # Inline the image through APIUtils, which shares its session and MIME detection with send_request
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(request.image_url) as response:
-                    if response.status == 200:
-                        image_bytes = await response.read()
-                        mime_type = 'image/jpeg'  # Default
-                        if request.image_url.lower().endswith('.png'):
-                            mime_type = 'image/png'
-                        elif request.image_url.lower().endswith('.webp'):
-                            mime_type = 'image/webp'
-
-                        import base64
-                        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                        content_list.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}
-                        })
+            data_url = await api_cog.fetch_image_data_url(request.image_url)
+            if data_url:
+                content_list.append({
+                    "type": "image_url",
+                    "image_url": {"url": data_url}
+                })
             conversation_messages.append({"role": "user", "content": content_list})
         except Exception as e:
             logger.error(f"Error processing image: {e}")
@@ -6,6 +6,8 @@ Handles all quota operations, validation, and usage tracking
 import json
 import os
 import logging
+import atexit
+import time
 from datetime import datetime, timezone
 from typing import Tuple, Optional, Dict
 from config_manager import config
@@ -24,6 +26,11 @@ class QuotaManager:
         os.makedirs(data_dir, exist_ok=True)
         
         self.quotas = self._load_quotas()
+        # Usage updates since the last save; persisted in batches by flush()
+        self._dirty = False
+        # Current month key and the epoch time it stops being current
+        self._month_key = ""
+        self._month_key_expires = 0.0
         self.default_monthly_quota = 1.0  # $1 per month default
         self.unlimited_user_ids = set(config.get('unlimited_user_ids', []))
         
@@ -43,12 +50,23 @@ class QuotaManager:
         try:
             with open(self.quota_file, 'w') as f:
                 json.dump(self.quotas, f, indent=2)
+            self._dirty = False
         except IOError as e:
             logger.error(f"Error saving quota file: {e}")
     
     def _get_current_month_key(self) -> str:
         """Get current month key for quota tracking (YYYY-MM format)"""
-        return datetime.now(timezone.utc).strftime("%Y-%m")
+        # Every quota read needs this, so it is formatted once per month rather than per call
+        now = time.time()
+        if now >= self._month_key_expires:
+            current = datetime.fromtimestamp(now, timezone.utc)
+            self._month_key = current.strftime("%Y-%m")
+            if current.month == 12:
+                next_month = datetime(current.year + 1, 1, 1, tzinfo=timezone.utc)
+            else:
+                next_month = datetime(current.year, current.month + 1, 1, tzinfo=timezone.utc)
+            self._month_key_expires = next_month.timestamp()
+        return self._month_key
     
     def _initialize_user(self, user_id: str):
         """Initialize a new user with default quota"""
@@ -102,10 +120,16 @@ class QuotaManager:
         current_usage = self.quotas[user_id]["usage"].get(month, 0.0)
         self.quotas[user_id]["usage"][month] = current_usage + cost
         
-        self._save_quotas()
+        # Reads see the new total immediately; the file write is batched by flush()
+        self._dirty = True
         logger.info(f"User {user_id} used ${cost:.4f}, total this month: ${current_usage + cost:.4f}")
         return True
     
+    def flush(self):
+        """Save usage recorded since the last write, if any"""
+        if self._dirty:
+            self._save_quotas()
+    
     def set_user_quota(self, user_id: str, quota: float):
         """Set user's monthly quota (admin function)"""
         self._initialize_user(user_id)
@@ -151,8 +175,9 @@ class QuotaManager:
 class QuotaValidator:
     """Validation interface for quota operations - maintains backward compatibility"""
     
-    def __init__(self):
-        self.quota_manager = QuotaManager()
+    def __init__(self, quota_manager: QuotaManager = None):
+        # Share the global manager so usage tracked here is flushed with everything else
+        self.quota_manager = quota_manager or QuotaManager()
     
     def check_user_quota(self, user_id: str) -> Tuple[bool, Optional[str]]:
         """
@@ -303,7 +328,8 @@ class QuotaValidator:
 
 # Create global instances for easy access
 quota_manager = QuotaManager()
-quota_validator = QuotaValidator()
+atexit.register(quota_manager.flush)
+quota_validator = QuotaValidator(quota_manager)
 
 
 # Export for easy importing